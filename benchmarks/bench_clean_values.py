@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#    License, authors, contributors and copyright information at:       #
+#    AUTHORS and LICENSE files at the root folder of this application   #
+#########################################################################
+
+''' Cost per million cells of the cleaning of the raw values while the files are read:
+    spaces removed and -999 values replaced by NaN
+
+        * old: the two regex replacements over all the cells of the chunk
+        * new: CruiseData._clean_values, one pass per column over the distinct values
+
+    The synthetic DataFrame has 10 columns of strings with flags, floats and integers,
+    the -999 variants (-999, -9999, -999.0, -999.000) and values padded with spaces
+
+    Usage: python benchmarks/bench_clean_values.py [--rows 1000000] [--repeat 3] [--no-old]
+'''
+
+import os
+import sys
+import types
+import argparse
+from timeit import default_timer as timer
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# NOTE: the packages are registered without running their __init__ files,
+#       which instantiate the handlers of the application (bokeh document, octave, ...)
+for name in ['ocean_data_qc', 'ocean_data_qc.data_models']:
+    module = types.ModuleType(name)
+    module.__path__ = [os.path.join(ROOT, *name.split('.'))]
+    sys.modules[name] = module
+
+from ocean_data_qc.constants import NA_REGEX_LIST
+from ocean_data_qc.data_models.cruise_data import CruiseData
+
+N_COLS = 10
+NA_VALUES = np.array(['-999', '-9999', '-999.0', '-999.000', ' -999 '])
+
+
+def get_raw_df(rows, seed=2020):
+    ''' String DataFrame as it is read from the csv files (dtype=str) '''
+    rng = np.random.default_rng(seed)
+    cols = {}
+    for i in range(N_COLS):
+        kind = i % 3
+        if kind == 0:       # flags
+            values = rng.choice(np.array(['2', '3', '4', '6', '9']), rows)
+        elif kind == 1:     # floats with 3 decimals, some of them padded
+            values = np.char.mod('%.3f', rng.uniform(0, 400, rows).round(3))
+            pad = rng.random(rows) < 0.1
+            values[pad] = np.char.add('  ', values[pad])
+        else:               # integers
+            values = np.char.mod('%d', rng.integers(1, 5000, rows))
+        values = values.astype(object)
+        na = rng.random(rows) < 0.05
+        values[na] = rng.choice(NA_VALUES, na.sum())
+        cols['COL{}'.format(i)] = values
+    return pd.DataFrame(cols)
+
+
+def clean_old(chunk):
+    chunk = chunk.replace(r'\s', '', regex=True)
+    return chunk.replace(to_replace=NA_REGEX_LIST, value=np.nan, regex=True)
+
+
+def clean_new(chunk, cd):
+    return cd._clean_chunk(chunk)
+
+
+def get_time(func, repeat):
+    times = []
+    for i in range(repeat):
+        start = timer()
+        res = func()
+        times.append(timer() - start)
+    return min(times), res
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-old', action='store_true', help='skip the old regex replacements')
+    args = parser.parse_args()
+
+    df = get_raw_df(args.rows)
+    cd = CruiseData.__new__(CruiseData)     # only the class attributes are needed to clean the values
+    million_cells = df.size / 1E6
+    print('>> {} ROWS x {} COLUMNS, pandas {}'.format(args.rows, N_COLS, pd.__version__))
+
+    t_new, res_new = get_time(lambda: clean_new(df, cd), args.repeat)
+    if not args.no_old:
+        t_old, res_old = get_time(lambda: clean_old(df), args.repeat)
+        pd.testing.assert_frame_equal(res_new.astype(object), res_old.astype(object))
+        print('>> OLD: {:.2f} s per million cells'.format(t_old / million_cells))
+    print('>> NEW: {:.2f} s per million cells'.format(t_new / million_cells))
@@ -87,8 +87,8 @@ class BokehEvents(Environment):
             selected_stts = list(self.env.wmts_map_source.data[STNNBR][new_indices])
             # self.env.cur_partial_stt_selection = selected_stts
 
-            # TODO: how to get all the indices of the current selected stations?? by self.env.cds_df is updated??
-            sel_inds = list(self.env.cds_df[self.env.cds_df[STNNBR].isin(selected_stts)].index)
+            # NOTE: the row positions of cruise_data.df and cds_df coincide
+            sel_inds = self.env.cruise_data.stt_index.get_rows(selected_stts, sort=True).tolist()
 
             self.env.source.selected.indices = sel_inds
             self._update_selection(
@@ -258,10 +258,11 @@ class BokehFlags(Environment):
             new_flag_value=flag_value,
             row_indices=row_indexes,
         )
-        new_values = np.array(self.env.source.data[flag_to_update], dtype=int)  # TODO: Int8 or Int64
+        new_values = np.array(self.env.cds_df[flag_to_update], dtype=FLAG_DTYPE)
         new_values[row_indexes] = flag_value
-        self.env.source.data[flag_to_update] = new_values
-        self.env.bk_sources.cds_df[flag_to_update] = new_values
+        if flag_to_update in self.env.source.data:     # only the flags of the plotted columns
+            self.env.source.data[flag_to_update] = new_values
+        self.env.cds_df[flag_to_update] = new_values
 
         # Updating flag colors
         self.env.doc.hold('collect')
@@ -154,7 +154,7 @@ class BokehPlotsHandler(Environment):
         '''
         lg.info('-- REPLOT COLOR CIRCLES')
         flags = {}
-        for i, val in enumerate(self.env.source.data[self.env.cur_flag]):
+        for i, val in enumerate(self.env.cds_df[self.env.cur_flag].to_numpy()):   # not all the flags are in the source
             flags.setdefault(int(val), []).append(i)
         tabs_to_update = []
         if only_cur_tab:
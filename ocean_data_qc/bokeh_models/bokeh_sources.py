@@ -14,7 +14,7 @@ from bokeh.palettes import Reds3
 
 from ocean_data_qc.env import Environment
 from ocean_data_qc.constants import *
-from ocean_data_qc.data_models.tools import merge
+from ocean_data_qc.data_models.tools import get_patches
 
 
 class BokehSources(Environment):
@@ -23,6 +23,10 @@ class BokehSources(Environment):
     def __init__(self, **kwargs):
         lg.info('-- INIT BOKEH DATA')
         self.env.bk_sources = self
+        self.pc_buffer = np.empty((0, 0))   # reused to build the pc_src columns in each selection
+        self.pc_cols = {}                   # {'TAB_COL_N': 'COL'} compound columns of pc_src
+        self.astk_cols = {}                 # {'TAB_COL': 'COL'} compound columns of astk_src
+        self.src_dtypes = {}                # {'COL': np.float32} columns sent as float32 to the sources
 
     def load_data(self):
         lg.info('-- LOAD DATA')
@@ -30,7 +34,7 @@ class BokehSources(Environment):
         self._init_cds_df()
         self._init_bathymetric_map_data()
         self.env.stations = self.env.cruise_data.stations
-        self.env.source = ColumnDataSource(self.env.cds_df)
+        self.env.source = ColumnDataSource(self._get_src_data(self.env.cds_df, cols=self._get_src_cols()))
         self._init_prof_ml_source()
         self._init_astk_src()
         self._init_all_flag_values()
@@ -38,15 +42,86 @@ class BokehSources(Environment):
     def _init_cds_df(self):
         ''' Create integer index on the dataframe
             The main DF has hashs strings as indices, so we need to create a new index
+            Only the columns used by the plots, the map and the data table are copied
             TODO: Should I create a multilevel index???
         '''
         if self.env.cruise_data.df is None:
             self.env.cruise_data.load_file()  # for AQC files
         length = len(self.env.cruise_data.df.index)
         index = np.array(np.array(list(range(0,length))))
-        self.env.cds_df = self.env.cruise_data.df.copy(deep=True)   # TODO: copy only the columns needed, not all of them??
+        cols = [STNNBR, 'LATITUDE', 'LONGITUDE', CTDPRS]
+        cols += self.env.cruise_data.get_cols_by_attrs(['param', 'flag']) + self.env.cur_plotted_cols
+        cols = [c for c in dict.fromkeys(cols) if c in self.env.cruise_data.df]
+        self.env.cds_df = self.env.cruise_data.df[cols].copy(deep=True)
         self.env.cds_df['INDEX'] = index                               # NOTE: the index will coincide with the row position
         self.env.cds_df = self.env.cds_df.set_index(['INDEX'])          #       so .iloc can be used in order to get the rows
+        self._set_src_dtypes()
+
+    def _set_src_dtypes(self):
+        ''' Sets the columns that can be sent as float32 to the sources without losing
+            any decimal of their precision. The rest of float columns are sent as float64.
+            The integer columns are also added if they are exact in float32, they are
+            converted to floats in the profile sources
+        '''
+        self.src_dtypes = {}
+        for c in self.env.cds_df.select_dtypes(include=['integer']).columns:
+            values = self.env.cds_df[c].to_numpy()
+            if values.size == 0 or np.abs(values).max() <= 2 ** 24:
+                self.src_dtypes[c] = np.float32
+        for c in self.env.cds_df.select_dtypes(include=['float64']).columns:
+            precision = self.env.cruise_data.cols.get(c, {}).get('precision', False)
+            if precision is False or precision is None:
+                continue
+            values = self.env.cds_df[c].to_numpy()
+            values = values[~np.isnan(values)]
+            if np.array_equal(
+                np.round(values.astype(np.float32).astype(np.float64), precision),
+                np.round(values, precision)
+            ):
+                self.src_dtypes[c] = np.float32
+
+    def _get_src_cols(self):
+        ''' Columns of the main source: the columns used by the glyphs and the hover
+            (plotted columns and their flags) and the stations. The tab layout changes
+            reload the sources, so the columns are updated with the plotted columns
+        '''
+        cols = [STNNBR]
+        for c in self.env.cur_plotted_cols:
+            cols += [c, c + FLAG_END]
+        return [c for c in dict.fromkeys(cols) if c in self.env.cds_df]
+
+    def _get_src_data(self, df, col_names={}, cols=None):
+        ''' Data of a ColumnDataSource built with contiguous typed NumPy arrays,
+            so Bokeh sends them as binary buffers instead of JSON lists:
+                * the float columns are sent as float32 if it is in self.src_dtypes
+                * the 64 bits integers as int32 (not supported as binary by BokehJS)
+                * the columns of arrays (multiline) as lists of arrays
+
+                @df - DataFrame with the data of the source, the index is added as a column
+                @col_names - name of the cds_df column of each compound column {'TAB_COL_N': 'COL'}
+                @cols - columns of df sent to the source, all of them by default
+        '''
+        data = {}
+        for c in (df.columns if cols is None else cols):
+            values = df[c].to_numpy()
+            if values.dtype.kind == 'f':
+                data[c] = np.ascontiguousarray(values, dtype=self.src_dtypes.get(col_names.get(c, c), values.dtype))
+            elif values.dtype.kind == 'i' and values.dtype.itemsize == 8:
+                data[c] = self._get_int32_values(values)
+            elif values.dtype.kind == 'O' and values.size > 0 and isinstance(values[0], np.ndarray):
+                data[c] = list(values)
+            else:
+                data[c] = values
+        data[df.index.name or 'index'] = self._get_int32_values(df.index.to_numpy())
+        return data
+
+    def _get_int32_values(self, values):
+        if (
+            values.dtype.kind == 'i' and values.size > 0
+            and np.iinfo(np.int32).min <= values.min() and values.max() <= np.iinfo(np.int32).max
+        ):
+            return values.astype(np.int32)
+        return values
 
     def _epsg4326_to_epsg3857(self, lon, lat):
         x = lon * 20037508.34 / 180
@@ -67,7 +142,7 @@ class BokehSources(Environment):
         aux_df = pd.DataFrame(dict(
             X_WMTS=x_wm,
             Y_WMTS=y_wm,
-            STNNBR=list(self.env.cds_df[STNNBR])
+            STNNBR=self.env.cds_df[STNNBR].to_numpy()
         ))
         aux_df.drop_duplicates(subset=STNNBR, keep='first', inplace=True)
         lg.info('>> AUX DF LEN: {}'.format(aux_df.index.size))
@@ -102,7 +177,7 @@ class BokehSources(Environment):
         for tab in self.env.f_handler.tab_list:
             flag = tab + FLAG_END
             flags = {}
-            for i, val in enumerate(self.env.source.data[flag]):
+            for i, val in enumerate(self.env.cds_df[flag].to_numpy()):   # not all the flags are in the source
                 flags.setdefault(int(val), []).append(i)
 
             flag_views = {}
@@ -123,6 +198,9 @@ class BokehSources(Environment):
                     * NITRAT >> Tab where the plot is drawn
                     * SALTNY >> Column data
                     * 5      >> Station number: (0, 1, 2, 3, 4 or 5) for NPROF = 6
+
+            The source only has the rows of the current profiles, so it is empty at the beginning.
+            self.env.pc_rows keeps the cds_df row position of each row of the source
         '''
         lg.info('-- INIT PROF CIRCLES SOURCES')
         d = {}
@@ -137,8 +215,9 @@ class BokehSources(Environment):
                     compound_cols.append('{}_{}_{}'.format(tab, graph.x, i))
                     compound_cols.append('{}_{}_{}'.format(tab, graph.y, i))
         compound_cols = list(set(compound_cols))
-        if compound_cols != []:
-            d = dict.fromkeys(compound_cols, np.array([np.nan] * self.env.cds_df.index.size))
+        for c in compound_cols:
+            d[c] = np.array([], dtype=float)
+        self.env.pc_rows = np.array([], dtype=int)
         self.env.pc_src = ColumnDataSource(d)
 
     def _init_prof_ml_source(self):
@@ -226,194 +305,95 @@ class BokehSources(Environment):
         if self.env.cur_partial_stt_selection == [] or force_selection:
             self._set_partial_stt_selection()  # len(partial_stt_selection) <= NPROF
 
-        # self._sync_with_patches()  # NOTE: sends less data but the algorythm takes longer to process
-        self._sync_with_full_df()
+        self._sync_with_patches()   # NOTE: the sources are replaced if the patches are not cheaper
 
-    def _sync_with_full_df(self):
-        lg.info('-- SYNC WITH FULL DF')
-        start = time.time()
-        astk_df = self._upd_astk_src()
-        self.env.astk_src.data = self.env.astk_src.from_df(astk_df)
-        p1 = time.time()
-        ml_df, df_fs, stt_order = self._get_ml_df()
-
-        if ml_df.index.size >= 1:
-            ml_df = ml_df.reindex(stt_order)
-            stt_colors = self.env.profile_colors[-len(stt_order):]
-            ml_df['colors'] = stt_colors        # [light blue, normal blue, darker blue, red]
-
-        p2 = time.time()
-        prof_df = self._upd_pc_srcs(df_fs, stt_order)
-        p3 = time.time()
-        self.env.ml_src.data = self.env.ml_src.from_df(ml_df)
-        self.env.pc_src.data = self.env.ml_src.from_df(prof_df)
-
-        # NOTE: this translates the selection indices into positional indices
-        #       bokeh with each ColumnDataSource uses a new index with consecutive integers [0, 1, 2, 3, ...]
-        #       it doesn´t matter if you have a different index in the DF that you use to create the CDS
-
-        prof_sel = []
-        for i in self.env.selection:   # TODO: only selected points within profiles
-            if i in prof_df.index:
-                prof_sel.append(prof_df.index.get_loc(i))
-        self.env.pc_src.selected.indices = prof_sel
-
-        p4 = time.time()
-        lg.info('>> TIME: ML: {} | PC: {} | SYNC: {} >> FULL ALGORITHM TIME: {}'.format(
-            round(p2 - p1, 2), round(p3 - p2, 2), round(p4 - p3, 2), round(p4 - start, 2)
-        ))
+    def _get_pc_selection(self):
+        ''' Translates the selection indices into positional indices of pc_src.
+            Bokeh with each ColumnDataSource uses a new index with consecutive integers [0, 1, 2, 3, ...]
+            it doesn´t matter if you have a different index in the DF that you use to create the CDS
+        '''
+        return np.flatnonzero(np.isin(self.env.pc_rows, self.env.selection)).tolist()
 
     def _sync_with_patches(self):
+        ''' Sends only the changed cells of the multiline and profile circle sources.
+            Each source is replaced completely if the patches are not cheaper,
+            for instance if the number of rows changed (new stations in pc_src)
+        '''
+        lg.info('-- SYNC WITH PATCHES')
         start = time.time()
         astk_df = self._upd_astk_src()
-        self.env.astk_src.data = self.env.astk_src.from_df(astk_df)
+        self.env.astk_src.data = self._get_src_data(astk_df, self.astk_cols)
         p1 = time.time()
-        ml_df, df_fs, stt_order = self._get_ml_df()
-        ml_patches = self._get_ml_src_patches(ml_df)
+        ml_df, df_fs, stt_order = self._get_sorted_ml_df()
+        ml_patched = self._patch_or_replace(self.env.ml_src, self._get_src_data(ml_df))
         p2 = time.time()
         prof_df = self._upd_pc_srcs(df_fs, stt_order)
-        pc_patches = self._get_pc_src_patches(prof_df)
+        pc_patched = self._patch_or_replace(self.env.pc_src, self._get_src_data(prof_df, self.pc_cols))
+        self.env.pc_rows = prof_df.index.to_numpy()
+        self.env.pc_src.selected.indices = self._get_pc_selection()
         p3 = time.time()
-        self.env.ml_src.patch(ml_patches)
-        self.env.pc_src.patch(pc_patches)
-        self.env.pc_src.selected.indices = self.env.selection
-        p4 = time.time()
-        lg.info('>> TIME: ML: {} | PC: {} | SYNC: {} >> FULL ALGORITHM TIME: {}'.format(
-            round(p2 - p1, 2), round(p3 - p2, 2), round(p4 - p3, 2), round(p4 - start, 2)
+        lg.info('>> TIME: ML: {} | PC: {} >> FULL ALGORITHM TIME: {} | PATCHED: ML: {}, PC: {}'.format(
+            round(p2 - p1, 2), round(p3 - p2, 2), round(p3 - start, 2), ml_patched, pc_patched
         ))
 
-    def _get_ml_src_patches(self, ml_df=None):
-        lg.info('-- GET ML SRC PATCHES')
-        ml_df.reset_index(drop=True, inplace=True)
-
-        # ml_src_df_old
-        ml_src_df_old = self.env.ml_src.to_df()
-        del ml_src_df_old['colors']          # colors are set in the initialization
-        ml_src_df_old = ml_src_df_old.applymap(
-            lambda x: None if x == [] else np.array([np.nan])
-        )
-        ml_src_df_old = ml_src_df_old.stack().reset_index(level=0)
-        s_old = ml_src_df_old.apply(lambda x: tuple(x), axis=1)
-        d_old = s_old.groupby(s_old.index).apply(lambda x: x.tolist()).to_dict()
-
-        # ml_src_df_new
-        ml_src_df_new = ml_df.applymap(lambda x: None if x == [''] else x)  # this is a replace
-        ml_src_df_new = ml_src_df_new.stack().reset_index(level=0)
-        s_new = ml_src_df_new.apply(lambda x: tuple(x), axis=1)
-        d_new = s_new.groupby(s_new.index).apply(lambda x: x.tolist()).to_dict()
-
-        ml_patches = merge(d_old, d_new)
-        return ml_patches
-
-    def _get_pc_src_patches(self, prof_df=None):
-        ''' Basically this method make these steps:
-                1. Get non-nan values positions to reset just them
-                2. Mix these positions with the new values
-                3. Reduce the number of slices by groups
-                4. Send patch
-
-                NOTE: How to patch NaN values: https://github.com/bokeh/bokeh/issues/7525
-                      The indices must be int (Int64 throws error)
+    def _patch_or_replace(self, src, new_data):
+        ''' Updates the source with the patches of the changed cells or with the new data
+                @return whether the source was patched
         '''
-        lg.info('-- GET PC SRC PATCHES')
-        # TODO: merge both dataframes in a different way, check if "merge", "join", or "assign" will work
-        # pc_df = self.env.pc_src.to_df()  # get values and convert to NaN, mark them with some flag??
-        # merged_df = pc_df.assign(**prof_df.to_dict())
-
-        pc_src_df_old = self.env.pc_src.to_df()
-        pc_src_d_old = {}
-        for c in pc_src_df_old.columns:
-            if pc_src_df_old[c].notnull().values.any():
-                s = pc_src_df_old[pc_src_df_old[c].notnull()][c]
-                pc_src_d_old[c] = list(zip(s.index, [np.nan] * s.index.size))
-
-        # lg.warning('>> OLD SRC VALUES: {}'.format(pc_src_d_old.get('PHSPHT_PRES_0', False)))
-
-        pc_src_d_new = {}
-        for c in prof_df.columns:
-            if prof_df[c].notnull().values.any():
-                s = prof_df[prof_df[c].notnull()][c]
-                pc_src_d_new[c] = list(zip(s.index, s))
-
-        # lg.warning('>> NEW SRC VALUES: {}'.format(pc_src_d_new.get('PHSPHT_PRES_0', False)))
-
-        def trans(ser):                     # TODO: move this to a tools.py file
-            indices = ser.index.tolist()
-            def build(last, cur, val):
-                if cur == last + 1:
-                    if np.isnan(val):
-                        return (slice(last, cur), np.array([np.nan]))
-                    else:
-                        return (last, val)
-                else:
-                    return (slice(last, cur), np.array([val] * (cur - last)))
-            last = ser.iloc[0]
-            old = last_index = indices[0]
-            resul = []
-            for i in indices[1:]:
-                val = ser[i]
-                if ((val != last) and not(np.isnan(val) and np.isnan(last))) \
-                   or i != old + 1:
-                    resul.append(build(last_index, old + 1, last))
-                    last_index = i
-                    last = val
-                old = i
-            resul.append(build(last_index, old+1, last))
-            return resul
-
-        if pc_src_d_old != {}:
-            patches = merge(pc_src_d_old, pc_src_d_new)
-        else:
-            patches = pc_src_d_new
-        for key in patches.keys():
-            patches[key] = trans(pd.Series(dict(patches[key])))
-        return patches
+        patches = get_patches(src.data, new_data)
+        if patches is None:
+            src.data = new_data
+            return False
+        if patches != {}:
+            src.patch(patches)
+        return True
+
+    def _get_sorted_ml_df(self):
+        ''' Multiline DataFrame with the stations sorted (the selected one at the end) and their colors '''
+        ml_df, df_fs, stt_order = self._get_ml_df()
+        if ml_df.index.size >= 1:
+            ml_df = ml_df.reindex(stt_order)
+            stt_colors = self.env.profile_colors[-len(stt_order):]
+            ml_df['colors'] = stt_colors        # [light blue, normal blue, darker blue, red]
+        return ml_df, df_fs, stt_order
 
     def _get_ml_df(self):
+        ''' Gets the profile lines of the selected stations for all the plots.
+            The rows of each station are taken from the station index of cruise_data,
+            where they are already sorted by pressure, so the values of each plot
+            are gathered with one fancy indexing and split by station
+        '''
         lg.info('-- GET ML DF')
         df_fs = None
         stt_order = []
         if self.env.cur_partial_stt_selection != []:
-            ml_df = pd.DataFrame(index=self.env.cur_partial_stt_selection, columns=[])
-            df_fs = self.env.cds_df[self.env.cds_df[STNNBR].isin(self.env.cur_partial_stt_selection)]
+            stt_index = self.env.cruise_data.stt_index
+            stt_rows = [stt_index.get_stt_rows(stt) for stt in self.env.cur_partial_stt_selection]
+            rows = np.concatenate(stt_rows)
+            splits = np.cumsum([r.size for r in stt_rows])[:-1]
+            df_fs = self.env.cds_df.iloc[rows]
 
             d_ml_df = {}
-            if self.env.plot_prof_invsbl_points:  # I do this outside the loop to gain efficiency
-                for bp in self.env.bk_plots:
-                    # FIXME: if one of the axis is CTDPRS then it gives an error here
-                    #       because the column is duplicated
-                    df_p =  df_fs[df_fs[bp.x].notnull() & df_fs[bp.y].notnull()].sort_values([CTDPRS], ascending=[True])
-                    if df_p.index.size >= 1:
-                        d_ml_df.update({
-                            'xs{}'.format(bp.n_plot): df_p.groupby(STNNBR).apply(lambda x: list(x[bp.x])),
-                            'ys{}'.format(bp.n_plot): df_p.groupby(STNNBR).apply(lambda x: list(x[bp.y])),
-                        })
-                    else:
-                        d_ml_df.update(**{
-                            'xs{}'.format(bp.n_plot): [np.nan for x in self.env.cur_partial_stt_selection],
-                            'ys{}'.format(bp.n_plot): [np.nan for x in self.env.cur_partial_stt_selection],
-                        })
-            else:
-                for bp in self.env.bk_plots:
-                    df_p =  df_fs[df_fs[bp.x].notnull() & df_fs[bp.y].notnull()].sort_values([CTDPRS], ascending=[True])
-                    df_p = df_p[df_p[bp.flag].isin(self.env.visible_flags)]
-                    if df_p.index.size >= 1:
-                        d_ml_df.update({
-                            'xs{}'.format(bp.n_plot): df_p.groupby(STNNBR).apply(lambda x: list(x[bp.x])),
-                            'ys{}'.format(bp.n_plot): df_p.groupby(STNNBR).apply(lambda x: list(x[bp.y])),
-                        })
+            for bp in self.env.bk_plots:
+                x = self.env.cds_df[bp.x].to_numpy()[rows].astype(self.src_dtypes.get(bp.x, np.float64))
+                y = self.env.cds_df[bp.y].to_numpy()[rows].astype(self.src_dtypes.get(bp.y, np.float64))
+                mask = pd.notnull(x) & pd.notnull(y)
+                if not self.env.plot_prof_invsbl_points:
+                    mask &= np.isin(self.env.cds_df[bp.flag].to_numpy()[rows], self.env.visible_flags)
+                xs, ys = [], []
+                for x_stt, y_stt, m_stt in zip(np.split(x, splits), np.split(y, splits), np.split(mask, splits)):
+                    if m_stt.any():
+                        xs.append(x_stt[m_stt])
+                        ys.append(y_stt[m_stt])
                     else:
-                        d_ml_df.update(**{
-                            'xs{}'.format(bp.n_plot): [np.nan for x in self.env.cur_partial_stt_selection],
-                            'ys{}'.format(bp.n_plot): [np.nan for x in self.env.cur_partial_stt_selection],
-                        })
-            ml_df = ml_df.assign(**d_ml_df)
+                        xs.append(np.array([np.nan]))
+                        ys.append(np.array([np.nan]))
+                d_ml_df['xs{}'.format(bp.n_plot)] = xs
+                d_ml_df['ys{}'.format(bp.n_plot)] = ys
+            ml_df = pd.DataFrame(d_ml_df, index=self.env.cur_partial_stt_selection)
             if ml_df.index.size >= 1:
                 stt_order = ml_df.index.drop(self.env.stt_to_select).tolist()
                 stt_order.append(self.env.stt_to_select)  # at the end
-                ml_df = ml_df.applymap(
-                    lambda x: x if isinstance(x, list) else np.array([np.nan])  # np.nan > np.array([np.nan])
-                )
             else:
                 ml_df = self._reset_ml_src()
         else:
@@ -466,60 +446,76 @@ class BokehSources(Environment):
         ''' Update profile circle sources. The self.env.pc_src is updated
             in order to mark the selected samples profiles over all the plots.
 
+            Only the rows of the selected stations are processed. Each column is gathered once
+            and written in a buffer with one row per compound column, which is reused across
+            the selections, so nothing is allocated with the size of the cruise.
+            The rows without values in any compound column are not returned
+
             @df_fs: DF with data only with the current stations to show
             @stt_order: selected stations, red color at the end of the list
         '''
         lg.info('-- UPDATE PROFILE CIRCLE SOURCES')
-        start = time.time()
-        prof_df = self._get_empty_prof_df()
-        tabs = self.env.f_handler.tab_list
-        if df_fs is not None:
-            stt_order_reversed = list(reversed(stt_order))
-            d_temp = {}
-            df_cur = df_fs.filter(self.env.cur_plotted_cols + [STNNBR])
-            for tab in tabs:
-                cur_cols_in_tab = self.env.f_handler.get_cols_in_tab(tab)
-                if self.env.plot_prof_invsbl_points is False:
-                    flag = self.env.tabs_flags_plots[tab]['flag']
-                    df_cur = df_fs[df_fs[flag].isin(self.env.visible_flags)]
-
-                i = NPROF - 1
-                for stt in stt_order_reversed:
-                    df_stt = df_cur[df_cur[STNNBR] == stt]
-                    for col in cur_cols_in_tab:  # TODO: only for cols that appear in the current processed tab
-                        df_aux = df_stt[col]
-                        d_temp['{}_{}_{}'.format(tab, col, i)] = df_aux
-                    i -= 1
-            prof_df = prof_df.assign(**d_temp)
-            prof_df.dropna(how='all', inplace=True)   # just in case there are some NaN rows lefovers
+        tab_cols = self._get_pc_tab_cols()
+        compound_cols = sorted(
+            '{}_{}_{}'.format(tab, col, n) for tab in tab_cols for col in tab_cols[tab] for n in range(NPROF)
+        )
+        if df_fs is None or stt_order == []:
+            return pd.DataFrame(columns=compound_cols, index=pd.Index([], name='INDEX', dtype=int))
+
+        stt_index = self.env.cruise_data.stt_index
+        rows = stt_index.get_rows(stt_order, sort=True)
+        stt_rows_pos = [    # positions in rows of each station, profile NPROF - 1 is the last station
+            (NPROF - 1 - i, np.searchsorted(rows, stt_index.get_stt_rows(stt)))
+            for i, stt in enumerate(reversed(stt_order))
+        ]
+        buf = self._get_pc_buffer(len(compound_cols), rows.size)
+        col_pos = {c: i for i, c in enumerate(compound_cols)}
+        self.pc_cols = {
+            '{}_{}_{}'.format(tab, col, n): col for tab in tab_cols for col in tab_cols[tab] for n in range(NPROF)
+        }
+        values = {}
+        for tab in tab_cols:
+            visible = None
+            if self.env.plot_prof_invsbl_points is False:
+                flag = self.env.tabs_flags_plots[tab]['flag']
+                visible = np.isin(self.env.cds_df[flag].to_numpy()[rows], self.env.visible_flags)
+            for col in tab_cols[tab]:
+                if col not in values:
+                    values[col] = self.env.cds_df[col].to_numpy()[rows].astype(float)
+                col_values = values[col] if visible is None else np.where(visible, values[col], np.nan)
+                for n, pos in stt_rows_pos:
+                    buf[col_pos['{}_{}_{}'.format(tab, col, n)], pos] = col_values[pos]
+
+        keep = ~np.isnan(buf).all(axis=0)      # just in case there are some NaN rows lefovers
+        prof_df = pd.DataFrame(
+            buf[:, keep].T, columns=compound_cols,
+            index=pd.Index(rows[keep], name='INDEX')
+        )
         return prof_df
 
-    def _get_empty_prof_df(self):
-        ''' DF initialization with empty values '''
-
-        lg.info('-- GET EMPTY PROF DF')
-        compound_cols = []
+    def _get_pc_tab_cols(self):
+        ''' Columns drawn in the plots of each tab: {'NITRAT': ['NITRAT', 'CTDPRS', ...], ...} '''
+        tab_cols = {}
         for tab in self.env.f_handler.tab_list:
-            plot_indices = self.env.tabs_flags_plots[tab]['plots']
-            aux_cols = []
-            for pi in plot_indices:
-                aux_cols.append(self.env.bk_plots[pi].x)
-                aux_cols.append(self.env.bk_plots[pi].y)
-            aux_cols = list(set(aux_cols))  # removes duplicates
-            # lg.info('>> AUX COLS: {}'.format(aux_cols))
-            for col in aux_cols:  # TODO: not all of them
-                for n in range(NPROF):
-                    compound_cols.append('{}_{}_{}'.format(tab, col, n))
-        compound_cols.sort()
-
-        d = {}
-        if compound_cols != []:
-            d = dict.fromkeys(compound_cols, np.array([np.nan] * self.env.cds_df.index.size))
-        prof_df = pd.DataFrame(d)  # init empty columns
-        prof_df['INDEX'] = self.env.cds_df.index
-        prof_df = prof_df.set_index(['INDEX'])
-
-        return prof_df
+            cols = []
+            for pi in self.env.tabs_flags_plots[tab]['plots']:
+                cols.append(self.env.bk_plots[pi].x)
+                cols.append(self.env.bk_plots[pi].y)
+            tab_cols[tab] = list(dict.fromkeys(cols))  # removes duplicates
+        return tab_cols
+
+    def _get_pc_buffer(self, n_cols, n_rows):
+        ''' Returns a view of the pc buffer with the requested shape filled with NaN.
+            The buffer is only allocated again if it is smaller than the requested shape
+        '''
+        if self.pc_buffer.shape[0] < n_cols or self.pc_buffer.shape[1] < n_rows:
+            self.pc_buffer = np.empty((
+                max(n_cols, self.pc_buffer.shape[0]),
+                max(n_rows, self.pc_buffer.shape[1])
+            ))
+        buf = self.pc_buffer[:n_cols, :n_rows]
+        buf.fill(np.nan)
+        return buf
 
     def _upd_astk_src(self):
         ''' Creates a new CDS with the new asterisk source data (selected sample)
@@ -536,6 +532,7 @@ class BokehSources(Environment):
             for tab in self.env.f_handler.tab_list:
                 for col in self.env.cur_plotted_cols:
                     columns.append('{}_{}'.format(tab, col))
+                    self.astk_cols['{}_{}'.format(tab, col)] = col
                     if self.env.plot_prof_invsbl_points:  # then always visible
                         values[pos] = self.env.cds_df.loc[self.env.sample_to_select, col]
                     else:
@@ -546,15 +543,15 @@ class BokehSources(Environment):
 
             # lg.info('>> COLUMNS: {}'.format(columns))
             # lg.info('>> VALUES: {}'.format(values))
-            df = pd.DataFrame(columns=columns)
+            df = pd.DataFrame(columns=columns, dtype=float)
             if any(not np.isnan(x) for x in values):
-                df.loc[self.env.sample_to_select] = values
+                df = pd.DataFrame([values], index=[self.env.sample_to_select], columns=columns, dtype=float)
         else: # posibbly reset
             lg.info('>> RESETTING ASTERISK')
             column_names = list(self.env.astk_src.data.keys())
             if 'index' in column_names:
                 column_names.remove('index')
-            df = pd.DataFrame(columns=column_names)
+            df = pd.DataFrame(columns=column_names, dtype=float)
         return df
 
     def _reset_ml_src(self):
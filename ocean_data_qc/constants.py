@@ -15,6 +15,15 @@ NPROF = 2 # 6       # Number of profiles
                 # NOTE: the maximum is 6 because if there are more there will be lag at loading time
                 # TODO: move this to env in order to make it updatable
 
+OCT_POOL_SIZE = 6               # Maximum number of octave sessions used to compute the equations in parallel
+OCT_CHUNK_MIN_SAMPLES = 1000    # Minimum number of samples sent to each octave session
+
+CSV_CHUNK_ROWS = 100000         # Number of rows of the csv files read, cleaned and converted at once
+
+PATCH_MAX_RATIO = 0.5           # If a larger ratio of cells of a source changed, the whole source is sent instead of patches
+
+CPS_CACHE_MAX_PROJECTS = 20     # Number of projects whose computed parameters are kept in the cache (the last used ones)
+
 # ----------------- STRING LITERALS ----------------------- #
 
 OUTPUT_BACKEND = 'canvas'    # Even if I change this to 'canvas',
@@ -22,10 +31,48 @@ OUTPUT_BACKEND = 'canvas'    # Even if I change this to 'canvas',
 STNNBR = 'STNNBR'           # Stations column
 CTDPRS = 'CTDPRS'           # Pressure
 FLAG_END = '_FLAG_W'        # Flag distinctive
+FLAG_DTYPE = 'uint8'        # Flag columns type, the flag values are between 0 and 9
 
 NA_REGEX_LIST = [r'^-999[9]?[\.0]*?$']
 NA_REGEX = '^-999[9]?[\.0]*?$'
 
+# ----------------- COMPUTED PARAMETERS ------------------- #
+
+# Equations that need the whole columns to compute each value,
+# so they cannot be recomputed only in the modified rows
+CP_NON_ROW_WISE_FUNCS = [
+    'nitrate_combined', 'salinity_combined', 'oxygen_combined',    # they read the columns from the DataFrame
+    'bfrq', 'gpan', 'gvel', 'dist',                                 # differences between consecutive samples
+]
+
+# Methods of OctaveEquations that are computed in python, they do not need an octave session
+CP_PYTHON_EQUATIONS = [
+    'pressure_combined', 'depth_combined', 'column_combined',
+    'nitrate_combined', 'salinity_combined', 'oxygen_combined',
+]
+
+# Methods of OctaveEquations that are not equations, they are not added to the sandbox
+CP_NON_EQUATION_METHODS = [
+    'guess_oct_exe_path', 'set_oct_exe_path', 'set_eq_backend', 'is_octave_available', 'start_octave',
+]
+
+# CANYON-B equations >> output names of the CANYONB octave function
+CANYONB_PARAMS = {
+    'alkali_nncanyonb_bit18': 'AT',
+    'tcarbn_nncanyonb_bit18': 'CT',
+    'nitrat_nncanyonb_bit18': 'NO3',
+    'phspht_nncanyonb_bit18': 'PO4',
+    'silcat_nncanyonb_bit18': 'SiOH4',
+    'phts25p0_nncanyonb_bit18': 'pHTS25P0',
+}
+
+# Columns read directly from the DataFrame by the equations without arguments
+CP_IMPLICIT_INPUT_COLS = {
+    'nitrate_combined': ['NITRAT', 'NITRIT', 'NO2_NO3'],
+    'salinity_combined': ['CTDSAL', 'SALNTY', 'CTDSAL_FLAG_W', 'SALNTY_FLAG_W'],
+    'oxygen_combined': ['CTDOXY', 'OXYGEN', 'CTDOXY_FLAG_W', 'OXYGEN_FLAG_W'],
+}
+
 # ---------------------- URLS ----------------------------- #
 
 ARGIS_TS = "https://server.arcgisonline.com/ArcGIS/rest/services/Ocean_Basemap/MapServer/tile/{Z}/{Y}/{X}/"
@@ -78,6 +125,7 @@ FILES = path.join(APPDATA, 'ocean-data-qc', 'files')
 TMP = path.join(APPDATA, 'ocean-data-qc', 'files', 'tmp')
 UPD = path.join(APPDATA, 'ocean-data-qc', 'files', 'tmp', 'update')
 EXPORT = path.join(APPDATA, 'ocean-data-qc', 'files', 'tmp', 'export')
+CPS_CACHE = path.join(APPDATA, 'ocean-data-qc', 'files', 'cps_cache')     # NOTE: out of TMP, it is not saved in the aqc files
 IMG = path.join(OCEAN_DATA_QC_PY, 'static', 'img')
 
 PROJ_SETTINGS = path.join(TMP, 'settings.json')
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#    License, authors, contributors and copyright information at:       #
+#    AUTHORS and LICENSE files at the root folder of this application   #
+#########################################################################
+
+from bokeh.util.logconfig import bokeh_logger as lg
+from ocean_data_qc.constants import *
+
+
+class ColumnRegistry(dict):
+    ''' Dictionary of columns and their attributes (CruiseData.cols) that keeps an index
+        of the columns that have each attribute. The index is updated when a column is
+        added, replaced or removed, so the columns of some attributes are got without
+        checking the attributes of all the columns:
+
+            {
+                'NITRAT': {'attrs': ['param'], 'unit': ..., 'precision': ..., 'export': ...},
+                'NITRAT_FLAG_W': {'attrs': ['flag'], ...},
+            }
+
+        NOTE: the attributes of a column must be modified with add_attr and rmv_attr,
+              if the list of attributes is modified directly the index is not updated
+    '''
+
+    def __init__(self, cols={}):
+        super(ColumnRegistry, self).__init__()
+        self.attr_index = {}    # {'param': {'NITRAT', ...}, 'flag': {'NITRAT_FLAG_W', ...}}
+        self.update(cols)
+
+    def __setitem__(self, column, value):
+        if column in self:
+            self._unindex(column)
+        super(ColumnRegistry, self).__setitem__(column, value)
+        for attr in value.get('attrs', []):
+            self.attr_index.setdefault(attr, set()).add(column)
+
+    def __delitem__(self, column):
+        self._unindex(column)
+        super(ColumnRegistry, self).__delitem__(column)
+
+    def __reduce__(self):
+        # NOTE: copies and pickles are plain dictionaries
+        return (dict, (dict(self), ))
+
+    def update(self, *args, **kwargs):
+        for column, value in dict(*args, **kwargs).items():
+            self[column] = value
+
+    def pop(self, column, *default):
+        if column in self:
+            self._unindex(column)
+        return super(ColumnRegistry, self).pop(column, *default)
+
+    def clear(self):
+        self.attr_index = {}
+        super(ColumnRegistry, self).clear()
+
+    def add_attr(self, column, attr):
+        if attr not in self[column]['attrs']:
+            self[column]['attrs'].append(attr)
+        self.attr_index.setdefault(attr, set()).add(column)
+
+    def rmv_attr(self, column, attr):
+        if attr in self[column]['attrs']:
+            self[column]['attrs'].remove(attr)
+        self.attr_index.get(attr, set()).discard(column)
+
+    def get_cols(self, attrs=[]):
+        ''' Returns the set of columns that have any of the attributes '''
+        res = set()
+        for attr in attrs:
+            res |= self.attr_index.get(attr, set())
+        return res
+
+    def _unindex(self, column):
+        for attr in dict.__getitem__(self, column).get('attrs', []):
+            self.attr_index.get(attr, set()).discard(column)
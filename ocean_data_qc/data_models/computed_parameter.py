@@ -7,25 +7,32 @@
 from bokeh.util.logconfig import bokeh_logger as lg
 from ocean_data_qc.constants import *
 from ocean_data_qc.data_models.exceptions import ValidationError
+from ocean_data_qc.data_models.equation_evaluator import EquationEvaluator, UnsupportedEquation
 from ocean_data_qc.env import Environment
 
-import json
+from collections import OrderedDict
 from os import path, environ, getenv
+import os
 import re
+import shutil
+import numpy as np
+import pandas as pd
+from hashlib import md5
 from math import *
 import seawater as sw
 import types
-import subprocess as sbp
 from importlib import import_module
 
 
 class ComputedParameter(Environment):
     env = Environment
+    funcs_version = None    # hash of the source code of the equations, computed once
 
     def __init__(self, cruise_data=False):
         lg.info('-- INIT COMPUTED PARAMETER')
         self.sandbox_vars = None
         self.sandbox_funcs = None
+        self.evaluator = None
         if cruise_data is not False:
             self.cruise_data = cruise_data
         else:
@@ -37,23 +44,38 @@ class ComputedParameter(Environment):
         self.import_octave_equations()
 
     def import_octave_equations(self):
+        ''' NOTE: octave is not run here. It is detected once for each path and started
+                  in the background only if any cp needs it, see _start_octave_if_needed
+        '''
         lg.info('>> OCTAVE PATH: {}'.format(self.env.oct_eq.oct_exe_path))
-        oc_output = sbp.getstatusoutput('{} --eval "OCTAVE_VERSION"'.format(self.env.oct_eq.oct_exe_path))
-        if oc_output[0] == 0:
-            lg.info('>> OCTAVE DETECTED FROM PYTHON, VERSION: {}'.format(
-                oc_output[1].split('=')[1].strip())
-            )
+        if self.env.oct_eq.is_octave_available():
             self.equations = self.env.oct_eq  # remove methods that are not equations
         else:
             lg.warning('>> OCTAVE UNDETECTED')
             self.equations = None
 
+    def _start_octave_if_needed(self, cps):
+        ''' Octave is started in the background while the rest of cps are computed
+            if any of them calls an equation that runs in octave
+        '''
+        if self.equations is None:
+            return
+        funcs = set()
+        for cp in cps:
+            funcs.update(re.findall(r'@([a-zA-Z_][a-zA-Z0-9_]*)', cp.get('equation', '')))
+        for func in funcs:
+            if (
+                func[0] != '_' and hasattr(self.equations, func)
+                and func not in CP_PYTHON_EQUATIONS and func not in CP_NON_EQUATION_METHODS
+                and not (self.env.eq_backend == 'numpy' and hasattr(self.env.oct_eq.np_eq, func))
+            ):
+                self.env.oct_eq.start_octave()
+                return
+
     @property
     def proj_settings_cps(self):
-        # TODO: this is executed many time when the app load a file, avoid multiple file reading to improve efficiency
         try:
-            proj_settings = json.load(open(PROJ_SETTINGS))
-            return proj_settings['computed_params'] if 'computed_params' in proj_settings else {}
+            return self.env.f_handler.get('computed_params', PROJ_SETTINGS) or {}
         except Exception:
             raise ValidationError(
                 'Project JSON settings file could be opened to process the calculated parameters',
@@ -75,35 +97,297 @@ class ComputedParameter(Environment):
 
         for cp in self.proj_settings_cps:  # NOTE: list of dicts, I need to iterate over all the items to get the cp to add
             if cp['param_name'] == val:
-                prec = int(cp['precision'])
-                new_cp = {
+                return self._add_computed_parameter(cp, prevent_save)
+
+    def _add_computed_parameter(self, cp, prevent_save=False):
+        val = cp['param_name']
+        prec = int(cp['precision'])
+        new_cp = {
+            'eq': cp['equation'],
+            'computed_param_name': cp['param_name'],
+            'precision': prec,
+        }
+        result = self.compute_equation(new_cp)
+        if result.get('success', False):
+            self._set_cp_col(cp)
+            if prevent_save is False:
+                self.cruise_data.save_col_attribs()
+            lg.info('>> CP <<{}>> ADDED'.format(val))
+        else:
+            msg = ''
+            if 'error' in result:
+                msg = result.get('error', '')  # TODO: remove "\n" fro here?
+            elif 'msg' in result:
+                msg = result.get('msg', '')
+            lg.warning('>> CP <<{}>> COULD NOT BE COMPUTED: {}'.format(
+                cp['param_name'], msg
+            ))
+        return result
+
+    def _set_cp_col(self, cp):
+        prec = int(cp['precision'])
+        self.cruise_data.cols[cp['param_name']] = {
+            'external_name': [],
+            'data_type': 'integer' if prec == 0 else 'float',
+            'attrs': ['computed'],
+            'unit': cp.get('units', False),
+            'precision': prec,
+            'export': False
+        }
+
+    def compile_cps(self, cps=None):
+        ''' Builds the dependency graph of the computed parameters and sorts them
+            in topological order, so the dependencies are always computed before.
+            The edges of the graph are the ${PARAM} references and the identifiers
+            of other computed parameters used directly in the equations.
+            The original order is kept when there is no dependency between two cps.
+
+                @cps - list of cps, all the project computed parameters by default
+                @return - (sorted list of cps, {'CP_NAME': ['DEPENDENCY_1', 'DEPENDENCY_2', ...]})
+
+            NOTE: the cps with circular dependencies are discarded
+        '''
+        if cps is None:
+            cps = self.proj_settings_cps
+        cps_by_name = OrderedDict([(cp['param_name'], cp) for cp in cps])
+        deps = {}
+        for name, cp in cps_by_name.items():
+            ids = set(re.findall(r'[a-zA-Z0-9_]+', cp.get('equation', '')))
+            deps[name] = [n for n in cps_by_name if n in ids and n != name]
+
+        sorted_cps = []
+        state = {}  # 'visiting' or 'done'
+        discarded = set()
+
+        def visit(name):
+            if state.get(name) == 'done':
+                return name not in discarded
+            if state.get(name) == 'visiting':
+                lg.warning('>> CIRCULAR DEPENDENCY IN THE COMPUTED PARAMETER: {}'.format(name))
+                discarded.add(name)
+                return False
+            state[name] = 'visiting'
+            deps_ok = [visit(d) for d in deps[name]]
+            state[name] = 'done'
+            if all(deps_ok) and name not in discarded:
+                sorted_cps.append(cps_by_name[name])
+                return True
+            discarded.add(name)
+            return False
+
+        for name in cps_by_name:
+            visit(name)
+        return sorted_cps, deps
+
+    def compute_cps(self, add=True, skip=[], changes=None, cache_dir=None):
+        ''' Computes all the project computed parameters following the dependency graph.
+            Each cp is computed only once and the cps that depend on it reuse its column.
+            If a cp cannot be computed the cps that depend on it are not computed either.
+
+                @add - whether the cps are added to cruise_data.cols or only computed
+                @skip - names of the cps that should not be computed
+                @changes - data modified since the last computation (see CruiseDataUpdate.upd_changes).
+                           If it is set only the affected cps are computed again, and only in the
+                           modified rows if the equation is computed row by row
+                @cache_dir - folder where the computed columns are stored in disk, in one subfolder per project.
+                             If it is set the cps with the same equation, input values and functions
+                             version are loaded from it
+                @return - list of the cps names that could not be computed
+        '''
+        sorted_cps, deps = self.compile_cps()
+        proj_cache_dir = None
+        if cache_dir is not None:
+            proj_cache_dir = path.join(cache_dir, self._get_proj_cache_key())
+        self._start_octave_if_needed([cp for cp in sorted_cps if cp['param_name'] not in skip])
+        failed = []
+        cache_keys = []
+        changed_rows = {}       # {'COLUMN': set of hash_ids with modified values}
+        full_cols = set()       # columns modified in all the rows
+        if changes is not None:
+            full_cols.update(changes.get('cols', []))
+            for column, hash_ids in changes.get('values', {}).items():
+                changed_rows[column] = set(hash_ids)
+        for cp in sorted_cps:
+            name = cp['param_name']
+            if name in skip:
+                continue
+            failed_deps = [d for d in deps[name] if d in failed]
+            if failed_deps != []:
+                lg.warning('>> CP <<{}>> COULD NOT BE COMPUTED: THE DEPENDENCIES {} FAILED'.format(
+                    name, failed_deps
+                ))
+                failed.append(name)
+                continue
+
+            if cache_dir is not None:
+                cache_key = self._get_cp_cache_key(cp)
+                cache_keys.append(cache_key)
+                if self._load_cached_cp(cp, proj_cache_dir, cache_key):
+                    lg.info('>> CP <<{}>> LOADED FROM CACHE'.format(name))
+                    if add:
+                        self._set_cp_col(cp)
+                    continue
+
+            rows = None     # all the rows
+            old_values = None
+            if changes is not None and name in self.cruise_data.df:
+                rows = self._get_rows_to_recompute(cp, changes, changed_rows, full_cols)
+                if rows is not None and len(rows) == 0:
+                    lg.info('>> CP <<{}>> NOT AFFECTED BY THE CHANGES'.format(name))
+                    changed_rows[name] = set()
+                    if add:
+                        self._set_cp_col(cp)
+                    continue
+                old_values = self.cruise_data.df[name].copy()
+
+            lg.info('>> COMPUTING PARAMETER: {}{}'.format(
+                name, '' if rows is None else ' | ROWS: {}'.format(len(rows))
+            ))
+            if add and rows is None:
+                result = self._add_computed_parameter(cp, prevent_save=True)
+            else:
+                result = self.compute_equation({
+                    'computed_param_name': name,
                     'eq': cp['equation'],
-                    'computed_param_name': cp['param_name'],
-                    'precision': prec,
-                }
-                result = self.compute_equation(new_cp)
-                if result.get('success', False):
-                    self.cruise_data.cols[val] = {
-                        'external_name': [],
-                        'data_type': 'integer' if prec == 0 else 'float',
-                        'attrs': ['computed'],
-                        'unit': cp.get('units', False),
-                        'precision': prec,
-                        'export': False
-                    }
-                    if prevent_save is False:
-                        self.cruise_data.save_col_attribs()
-                    lg.info('>> CP <<{}>> ADDED'.format(val))
+                    'precision': cp['precision'],
+                    'rows': rows,
+                })
+                if add and result.get('success', False):
+                    self._set_cp_col(cp)
+            if result.get('success', False) is False:
+                failed.append(name)
+                continue
+            if cache_dir is not None:
+                self._store_cached_cp(cp, proj_cache_dir, cache_key)
+            if changes is not None:
+                if old_values is None:
+                    full_cols.add(name)
                 else:
-                    msg = ''
-                    if 'error' in result:
-                        msg = result.get('error', '')  # TODO: remove "\n" fro here?
-                    elif 'msg' in result:
-                        msg = result.get('msg', '')
-                    lg.warning('>> CP <<{}>> COULD NOT BE COMPUTED: {}'.format(
-                        cp['param_name'], msg
-                    ))
-                return result
+                    new_values = self.cruise_data.df[name]
+                    diff = (old_values != new_values) & ~(old_values.isnull() & new_values.isnull())
+                    changed_rows[name] = set(new_values.index[diff])
+        if cache_dir is not None:
+            self._prune_cps_cache(cache_dir, proj_cache_dir, cache_keys)
+        return failed
+
+    def _get_proj_cache_key(self):
+        ''' The cache of each project is stored in a subfolder named by a hash of the HASH_ID index '''
+        index_hash = pd.util.hash_pandas_object(self.cruise_data.df.index).to_numpy()
+        return md5(index_hash.tobytes()).hexdigest()
+
+    def _get_cp_cache_key(self, cp):
+        ''' The key is a hash of the equation, the values of the input columns
+            (aligned by the HASH_ID index) and the version of the functions
+        '''
+        df = self.cruise_data.df
+        ids = sorted(set(re.findall(r'[a-zA-Z0-9_]+', cp.get('equation', ''))))
+        for func, cols in CP_IMPLICIT_INPUT_COLS.items():
+            if func in ids:
+                ids = sorted(set(ids + cols))
+        key = md5()
+        key.update('{}|{}|{}|{}'.format(
+            cp['equation'], cp['precision'], self._get_funcs_version(), self.env.eq_backend
+        ).encode())
+        key.update(pd.util.hash_pandas_object(df.index).to_numpy().tobytes())
+        for i in ids:
+            if i in df.columns:
+                key.update(i.encode())
+                key.update(pd.util.hash_pandas_object(df[i], index=False).to_numpy().tobytes())
+        return key.hexdigest()
+
+    def _get_funcs_version(self):
+        ''' Hash of the files where the equations are implemented.
+            If any of them changes all the cached cps are computed again
+        '''
+        if ComputedParameter.funcs_version is None:
+            version = md5()
+            version.update(getattr(sw, '__version__', '').encode())
+            f_paths = [
+                path.join(OCEAN_DATA_QC_PY, 'data_models', 'octave_equations.py'),
+                path.join(OCEAN_DATA_QC_PY, 'data_models', 'numpy_equations.py'),
+            ]
+            for root, dirs, files in sorted(os.walk(path.join(OCEAN_DATA_QC_PY, 'octave'))):
+                f_paths += [path.join(root, f) for f in sorted(files)]
+            for f_path in f_paths:
+                with open(f_path, 'rb') as f:
+                    version.update(f.read())
+            ComputedParameter.funcs_version = version.hexdigest()
+        return ComputedParameter.funcs_version
+
+    def _load_cached_cp(self, cp, cache_dir, cache_key):
+        f_path = path.join(cache_dir, '{}.npy'.format(cache_key))
+        if not path.isfile(f_path):
+            return False
+        try:
+            values = np.load(f_path, allow_pickle=False)
+        except Exception as e:
+            lg.warning('>> THE CACHED CP <<{}>> COULD NOT BE LOADED: {}'.format(cp['param_name'], e))
+            return False
+        if values.size != self.cruise_data.df.index.size:
+            return False
+        self.cruise_data.df[cp['param_name']] = values
+        return True
+
+    def _store_cached_cp(self, cp, cache_dir, cache_key):
+        try:
+            if not path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            np.save(
+                path.join(cache_dir, '{}.npy'.format(cache_key)),
+                self.cruise_data.df[cp['param_name']].to_numpy(dtype=float)
+            )
+        except Exception as e:
+            lg.warning('>> THE CP <<{}>> COULD NOT BE STORED IN THE CACHE: {}'.format(cp['param_name'], e))
+
+    def _prune_cps_cache(self, cache_dir, proj_cache_dir, cache_keys):
+        ''' Removes the cached columns of the project that were not used in the last computation,
+            and the subfolders of the projects that were not used lately (CPS_CACHE_MAX_PROJECTS)
+        '''
+        if not path.isdir(proj_cache_dir):
+            return
+        for f_name in os.listdir(proj_cache_dir):
+            if f_name[:-4] not in cache_keys:
+                try:
+                    os.remove(path.join(proj_cache_dir, f_name))
+                except Exception:
+                    lg.warning('>> THE CACHED FILE {} COULD NOT BE REMOVED'.format(f_name))
+        os.utime(proj_cache_dir)    # NOTE: the modification time is the last time the project was used
+
+        proj_dirs = [path.join(cache_dir, d) for d in os.listdir(cache_dir)]
+        proj_dirs = sorted([d for d in proj_dirs if path.isdir(d)], key=path.getmtime, reverse=True)
+        for d in proj_dirs[CPS_CACHE_MAX_PROJECTS:]:
+            try:
+                shutil.rmtree(d)
+            except Exception:
+                lg.warning('>> THE CACHE FOLDER {} COULD NOT BE REMOVED'.format(d))
+
+    def _get_rows_to_recompute(self, cp, changes, changed_rows, full_cols):
+        ''' Returns the hash_ids of the rows that should be computed again,
+            None if the whole column should be computed again
+
+                @changes - see CruiseDataUpdate.upd_changes
+                @changed_rows - {'COLUMN': set of hash_ids} with the rows modified so far
+                @full_cols - columns modified in all the rows
+        '''
+        ids = set(re.findall(r'[a-zA-Z0-9_]+', cp.get('equation', '')))
+        inputs = set(ids)
+        for func, cols in CP_IMPLICIT_INPUT_COLS.items():
+            if func in ids:
+                inputs.update(cols)
+        if any(i in full_cols for i in inputs):
+            return None
+
+        rows = set()
+        for i in inputs:
+            rows.update(changed_rows.get(i, set()))
+        row_wise = not any(func in ids for func in CP_NON_ROW_WISE_FUNCS)
+        if not row_wise:
+            if rows or changes.get('add_rows', []) != [] or changes.get('rmv_rows', False):
+                return None
+            return []
+        rows.update(changes.get('add_rows', []))
+        df_index = self.cruise_data.df.index
+        return list(df_index[df_index.isin(rows)])
 
     def compute_equation(self, args):
         try:
@@ -125,6 +409,8 @@ class ComputedParameter(Environment):
             inner_word = match.group(0)
             new_var = False
             param_name = inner_word[2:-1]   # removin characters: ${PARAM} >> PARAM
+            if param_name in self.cruise_data.df.columns:
+                return param_name           # already computed, the column is reused
             for elem in self.proj_settings_cps:
                 if elem['param_name'] == param_name:
                     new_var = '({})'.format(elem.get('equation', False))
@@ -139,6 +425,7 @@ class ComputedParameter(Environment):
 
         if self.sandbox_funcs is None:
             self.sandbox_funcs = self._get_sandbox_funcs(locals())
+            self.evaluator = EquationEvaluator(self.sandbox_funcs)
         if self.sandbox_vars is None:
             self.sandbox_vars = self._get_sandbox_vars(globals())
         ids = self._get_eq_ids(eq)
@@ -151,26 +438,39 @@ class ComputedParameter(Environment):
                     'msg': 'Some identifiers do not exist in the current dataframe: {}'.format(i),
                 }
 
-        eq = '{} = {}'.format(computed_param_name, eq)
         # lg.info('>> EQUATION: {}'.format(eq))
+        rows = args.get('rows', None)
+        df = self.cruise_data.df if rows is None else self.cruise_data.df.loc[rows]
         try:
-            self.cruise_data.df.eval(
-                expr=eq,
-                engine='python',                 # NOTE: numexpr does not support custom functions
-                inplace=True,
-                local_dict=self.sandbox_funcs,
-                global_dict=self.sandbox_vars
-            )
+            try:
+                values = self.evaluator.evaluate(eq, df)
+            except UnsupportedEquation as e:
+                lg.info('>> EQUATION EVALUATED WITH THE PYTHON ENGINE: {}'.format(e))
+                values = df.eval(
+                    expr=eq,
+                    engine='python',                 # NOTE: numexpr does not support custom functions
+                    local_dict=self.sandbox_funcs,
+                    global_dict=self.sandbox_vars
+                )
+            if rows is None:
+                self.cruise_data.df[computed_param_name] = values
+            else:
+                # NOTE: only the rows sent are computed, the rest of the column is kept
+                sub_df = pd.DataFrame(index=df.index)
+                sub_df[computed_param_name] = values
+                self.cruise_data.df.loc[rows, computed_param_name] = sub_df[computed_param_name].round(
+                    precision
+                ).to_numpy()
         except Exception as e:
             # lg.warning('>> THE CP {} COULD NOT BE CALCULATED: {}'.format(computed_param_name, e))
             return {
                 'success': False,
-                'msg': 'The equation could not be computed: {}'.format(eq),
+                'msg': 'The equation could not be computed: {} = {}'.format(computed_param_name, eq),
                 'error': '{}'.format(e),
             }
         if computed_param_name == 'AUX' and 'AUX' in self.cruise_data.df.columns:
             del self.cruise_data.df['AUX']
-        else:
+        elif rows is None:
             self.cruise_data.df = self.cruise_data.df.round({computed_param_name: precision})
 
         return {
@@ -232,13 +532,19 @@ class ComputedParameter(Environment):
         })
         if self.equations is not None:
             for elem_str in dir(self.equations):
-                if elem_str[0] != '_' and elem_str not in ['guess_oct_exe_path', 'set_oct_exe_path']:
+                if elem_str[0] != '_' and elem_str not in CP_NON_EQUATION_METHODS:
                     elem_obj = getattr(self.equations, elem_str)
                     if isinstance(elem_obj, (\
                     types.FunctionType, types.BuiltinFunctionType,
                     types.MethodType, types.BuiltinMethodType)):
                         # lg.info('>> ACCEPTED METHOD: {}'.format(elem_str))
                         local_dict.update({elem_str: elem_obj})
+        elif self.env.eq_backend == 'numpy':
+            # NOTE: the NumPy ports do not need octave, so they are available anyway
+            np_eq = self.env.oct_eq.np_eq
+            for elem_str in dir(np_eq):
+                if elem_str[0] != '_':
+                    local_dict.update({elem_str: getattr(np_eq, elem_str)})
         return local_dict
 
     def _get_sandbox_vars(self, glob_dict={}):
@@ -260,9 +566,8 @@ class ComputedParameter(Environment):
                 'cp_param_2': False,                 # dependencies don't satisfied
             }
         '''
-        proj_settings = json.load(open(PROJ_SETTINGS))
-        computed_params = proj_settings.get('computed_params', False)
-        if computed_params is not False:
+        computed_params = self.proj_settings_cps
+        if computed_params:
             result = {}
             for cp in computed_params:
                 args = {
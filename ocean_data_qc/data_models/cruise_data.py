@@ -9,6 +9,8 @@ from ocean_data_qc.constants import *
 from ocean_data_qc.data_models.exceptions import ValidationError
 from ocean_data_qc.data_models.computed_parameter import ComputedParameter
 from ocean_data_qc.data_models.cruise_data_export import CruiseDataExport
+from ocean_data_qc.data_models.column_registry import ColumnRegistry
+from ocean_data_qc.data_models.station_index import StationIndex
 
 import csv
 import json
@@ -27,26 +29,44 @@ class CruiseData(CruiseDataExport):
         the aqc, csv and whp files (instantiated with the children classes)
     '''
     env = CruiseDataExport.env
+    spaces_regex = re.compile(r'\s')
+    na_regex = re.compile(NA_REGEX)
 
     def __init__(self, original_type='', cd_aux=False):
         lg.info('-- INIT CRUISE DATA PARENT')
         self.original_type = original_type        # original.csv type (whp, csv)
         self.cd_aux = cd_aux
         self.df = None                            # numeric DataFrame
-        self.df_str = None                        # string DataFrame
         self.moves = None
         self.cols = {}
+        self.col_positions = (None, {})          # (df.columns, {'COL1': 0, 'COL2': 1, ...})
+        self.stt_idx = None                      # StationIndex of the current rows
         self.col_mappings = {}                   # to set in external_name
         self.unit_list = []
+        self.units_row = None                    # whether the file has a units row, set with the first chunk
+        self.raw_col_names = {}                  # {'COL': 'column name in the file'}
+        self.col_names = {}                      # {'column name in the file': 'COL'}
+        self.na_cols = {}                        # {'COL': True if all the values in the file are -999}
+        self.col_precisions = {}                 # {'COL': max number of decimals, None if there is no decimal point}
 
         self._validate_original_data()
         self._set_moves()                         # TODO: this is not needed for cd_update
         self._set_df()
         self._rmv_empty_columns()
-        self._set_units()
         self._prep_df_columns()
         self.cp_param = ComputedParameter(self)
 
+    @property
+    def cols(self):
+        return self._cols
+
+    @cols.setter
+    def cols(self, value):
+        ''' The columns are always stored in a ColumnRegistry to keep the index of attributes '''
+        if not isinstance(value, ColumnRegistry):
+            value = ColumnRegistry(value or {})
+        self._cols = value
+
     def _rmv_empty_columns(self):
         lg.info('-- REMOVE EMPTY COLUMNS (all values with -999)')
         cols_to_rmv = []
@@ -54,7 +74,7 @@ class CruiseData(CruiseDataExport):
         basic_params = self.env.f_handler.get_custom_cols_by_attr('basic')
         for col in self.df:
             if col not in basic_params:  # empty basic param columns are needed for some calculated params
-                if self.df[col].str.contains(NA_REGEX).all():
+                if self.na_cols.get(col, False):     # checked while the file was read
                     cols_to_rmv.append(col)
                     if f'{col}_FLAG_W' in self.df:
                         flags_to_rmv.append(f'{col}_FLAG_W')
@@ -71,6 +91,8 @@ class CruiseData(CruiseDataExport):
                 f'{",".join(flags_to_rmv)} flag columns were removed'
             )
         cols_to_rmv.extend(flags_to_rmv)
+        if self.unit_list != []:     # the units are in the same order as the columns of the file
+            self.unit_list = [u for c, u in zip(self.df.columns, self.unit_list) if c not in cols_to_rmv]
         self.df = self.df.drop(columns=cols_to_rmv)
 
     def _set_cols_from_scratch(self):
@@ -123,12 +145,15 @@ class CruiseData(CruiseDataExport):
         del self.unit_list
         # lg.info(json.dumps(self.cols, sort_keys=True, indent=4))
 
-    def _set_units(self):
+    def _set_units(self, units_raw):
         ''' Checks if the file has an unit row or not.
-            The df should have all strings and nan values
+            The first row should have all strings and nan values
                 * if there is at least one nan in the row               > unit row
                 * if all the cells are strings                          > unit row
                 * if there is at least one number (stored as string)    > no unit row
+
+            @units_raw - values of the first row of the file
+            @return - True if the first row is the units row
         '''
         lg.info('-- CHECK IF THE UNIT ROW EXISTS')
         exp = re.compile("^-?\d+?(\.\d+)?$")
@@ -140,7 +165,6 @@ class CruiseData(CruiseDataExport):
                 return s.isdigit()  # to check if all are digits
             return True
 
-        units_raw = self.df.iloc[0].values.tolist()
         no_unit_row = False
         for u in units_raw:  # the loop continues only if it is a string and not number
             if not isinstance(u, str) and np.isnan(u):
@@ -149,12 +173,12 @@ class CruiseData(CruiseDataExport):
                 no_unit_row = True
                 break
         if no_unit_row is False:
-            self.df = self.df[1:-1].reset_index(drop=True)  # rewrite index column and remove the units row
             for u in units_raw:
                 if isinstance(u, str):
                     self.unit_list.append(u.strip())
                 else:
                     self.unit_list.append('nan')
+        return not no_unit_row
 
     def _validate_flag_values(self):
         ''' Assign 9 to the rows where the param has an NaN
@@ -166,9 +190,7 @@ class CruiseData(CruiseDataExport):
             if flag in self.df:
                 upds = self.df[self.df[param].isnull() & (self.df[flag] != 9)].index.tolist()
                 if len(upds) > 0:
-                    empty_rows = {}
-                    empty_rows[flag] = 9
-                    self.df[self.df[param].isnull() & (self.df[flag] != 9)] = self.df[self.df[param].isnull() & (self.df[flag] != 9)].assign(**empty_rows)
+                    self.df.loc[upds, flag] = 9
                     self.add_moves_element(
                         'flag_column_updated',
                         f'The flag column {flag} had some NaN values in the related parameter column. '
@@ -192,6 +214,17 @@ class CruiseData(CruiseDataExport):
                         ),
                         rollback=self.rollback
                     )
+        self._set_flag_dtypes()
+
+    def _set_flag_dtypes(self):
+        ''' Stores all the flag columns with the same compact type (FLAG_DTYPE).
+            The type can change when a column is downcast with other values or when
+            some rows are added with NaN or python integers. The columns with null values
+            are not converted, they are checked by _validate_flag_values
+        '''
+        for flag in self.get_cols_by_attrs(['flag']):
+            if flag in self.df and self.df[flag].dtype != FLAG_DTYPE and not self.df[flag].isnull().any():
+                self.df[flag] = self.df[flag].astype(FLAG_DTYPE)
 
     def _add_column(self, column='', units=False, export=True):
         ''' Adds a column to the self.cols dictionary
@@ -216,18 +249,18 @@ class CruiseData(CruiseDataExport):
             }
             non_qc_params = self.env.f_handler.get_custom_cols_by_attr('non_qc')
             if column.endswith(FLAG_END):
-                self.cols[column]['attrs'] += ['flag']
+                self.cols.add_attr(column, 'flag')
             else:
                 basic_params = self.env.f_handler.get_custom_cols_by_attr('basic')
                 if column in basic_params:
-                    self.cols[column]['attrs'] += ['basic']
+                    self.cols.add_attr(column, 'basic')
                 required_cols = self.env.f_handler.get_custom_cols_by_attr('required')
                 if column in required_cols:
-                    self.cols[column]['attrs'] += ['required']
+                    self.cols.add_attr(column, 'required')
                 elif column in non_qc_params:
-                    self.cols[column]['attrs'] += ['non_qc']
+                    self.cols.add_attr(column, 'non_qc')
                 else:
-                    self.cols[column]['attrs'] += ['param']
+                    self.cols.add_attr(column, 'param')
                 self.create_missing_flag_col(column)
         else:
             lg.warning('>> THE COLUMN ALREADY EXISTS AND IT CANNOT BE CREATED AGAIN')
@@ -239,8 +272,7 @@ class CruiseData(CruiseDataExport):
             non_qc_params = self.env.f_handler.get_custom_cols_by_attr('non_qc')
             if flag not in self.df and param not in non_qc_params:
                 lg.info('>> CREATING FLAG COLUMN: {}'.format(flag))
-                values = ['2'] * len(self.df.index)
-                self.df[flag] = values
+                self.df[flag] = np.full(self.df.index.size, 2, dtype=FLAG_DTYPE)
                 self.cols[flag] = {
                     'external_name': [],
                     'attrs': ['flag', 'created'],
@@ -279,7 +311,7 @@ class CruiseData(CruiseDataExport):
 
     def get_cols_from_settings_file(self):
         """ The columns are set directly from the settings.json file """
-        self.cols = self.env.f_handler.get('columns', path.join(TMP, 'settings.json'))
+        self.cols = self.env.f_handler.get('columns', path.join(TMP, 'settings.json'), deep_copy=True)
 
     def get_cols_by_attrs(self, column_attrs=[], discard_nan=False):
         ''' Possible attrs:
@@ -305,30 +337,27 @@ class CruiseData(CruiseDataExport):
                 'computed', 'param', 'non_qc',
                 'flag', 'required', 'created'
             ]
-        res = []
-        for t in column_attrs:
-            for c in self.cols:
-                if t in self.cols[c]['attrs']:
-                    if c not in res:
-                        res.append(c)
-        res = list(set(res))  # one column may have multiple attrs
-        df_cols = list(self.df.columns)
-        col_positions = dict(
-            [(df_cols[df_cols.index(x)], df_cols.index(x)) for x in df_cols]  # {'COL1': 0, 'COL2': 1, ...}
-        )
+        res = self.cols.get_cols(column_attrs)     # one column may have multiple attrs
+        col_positions = self._get_col_positions()
         try:
-            prepaired_list = [(col_positions[x], x) for x in res]
-        except Exception:
+            final_list = sorted(res, key=lambda x: col_positions[x])
+        except KeyError:
             raise ValidationError(
                 'Some columns in the settings.json file or '
                 'self.cols object is not in the DataFrame'
             )
-        sorted_list = sorted(prepaired_list, key=lambda elem: elem[0])  # reordering
-        final_list = [x[1] for x in sorted_list]
         if discard_nan:
             final_list = self._discard_nan_columns(final_list)
         return final_list
 
+    def _get_col_positions(self):
+        ''' The positions are computed again only if the columns of the DataFrame change '''
+        if self.col_positions[0] is not self.df.columns:
+            self.col_positions = (
+                self.df.columns, {c: i for i, c in enumerate(self.df.columns)}
+            )
+        return self.col_positions[1]
+
     def _discard_nan_columns(self, col_list):
         ''' Most of NaN columns should be removed in "manage_empty_cols"
             This is just for the 'required' columns which are empty
@@ -342,7 +371,20 @@ class CruiseData(CruiseDataExport):
 
     @property
     def stations(self):
-        return list(self.df.drop_duplicates(STNNBR)[STNNBR])
+        return list(self.stt_index.stations)
+
+    @property
+    def stt_index(self):
+        ''' Index of the row positions of each station. It is built again if the rows
+            of the DataFrame changed. If the values of STNNBR or CTDPRS are updated
+            in place reset_stt_index should be called
+        '''
+        if self.stt_idx is None or self.stt_idx.df_index is not self.df.index:
+            self.stt_idx = StationIndex(self.df)
+        return self.stt_idx
+
+    def reset_stt_index(self):
+        self.stt_idx = None
 
     def get_units(self, cols):
         return [self.cols[x]['unit'] for x in cols]
@@ -354,47 +396,161 @@ class CruiseData(CruiseDataExport):
             return False
 
     def _set_df(self):
-        """ it creates the self.df dataframe object
-            taking into account if data.csv is created or not
-        """
+        ''' The file is read in chunks of CSV_CHUNK_ROWS rows. Each chunk is cleaned and converted
+            to numbers before reading the next one, so the string values of the whole file are not
+            in memory at the same time. The final DataFrame is built once with the converted chunks.
+
+            The columns with any value that is not a number are kept as strings. If a column
+            is numeric in the first chunks, but not in the rest, it is read again as strings
+        '''
         lg.info('-- SET DF')
+        chunks = []
+        str_cols = set()        # columns with any value that is not a number
+        num_cols = set()        # columns converted to numbers in any chunk
+        for chunk in self._iter_data_chunks():
+            chunk = self._clean_chunk(chunk)
+            for c in chunk.columns:
+                if c in (STNNBR, 'TIME') or c in str_cols:     # stations and time are always strings
+                    continue
+                values = pd.to_numeric(chunk[c], errors='coerce')
+                if (values.isnull() & chunk[c].notnull()).any():
+                    str_cols.add(c)
+                    continue
+                if values.dtype.kind == 'f':
+                    self._update_col_precision(c, chunk[c])
+                chunk[c] = values
+                num_cols.add(c)
+            chunks.append(chunk)
+
+        if chunks == []:
+            self.df = pd.DataFrame(columns=list(self.raw_col_names.keys()), dtype=str)
+            return
+        self.df = pd.concat(chunks, ignore_index=True)
+        del chunks
+
+        reread_cols = [c for c in str_cols if c in num_cols]
+        if reread_cols != []:
+            lg.warning('>> READING AGAIN AS STRINGS THE COLUMNS: {}'.format(reread_cols))
+            str_chunks = [
+                self._clean_chunk(chunk) for chunk in self._iter_data_chunks(
+                    usecols=[self.raw_col_names[c] for c in reread_cols]
+                )
+            ]
+            str_df = pd.concat(str_chunks, ignore_index=True)
+            for c in reread_cols:
+                self.df[c] = str_df[c].astype(object)
+                self.col_precisions.pop(c, None)
+        for c in num_cols - str_cols:
+            self.df[c] = pd.to_numeric(self.df[c], downcast='integer')
+
+    def _read_csv_chunks(self, usecols=None):
+        ''' Yields the raw chunks of the file as strings. If the 'c' engine fails
+            the chunks that were not read yet are read with the 'python' engine
+        '''
         try:
             delimiter=self.dialect.delimiter
         except:
             delimiter=','
+        kwargs = dict(
+            comment='#',
+            delimiter=delimiter,
+            skip_blank_lines=True,
+            skipinitialspace=True,
+            dtype=str,                  # useful to make some replacements before casting to numeric values
+            skiprows=self.skiprows,
+            usecols=usecols,
+            chunksize=CSV_CHUNK_ROWS,
+            # verbose=False             # indicates the number of NA values placed in non-numeric columns
+        )
+        n_chunks = 0
         try:
-            self.df = pd.read_csv(
-                filepath_or_buffer=self.filepath_or_buffer,
-                comment='#',
-                delimiter=delimiter,
-                skip_blank_lines=True,
-                skipinitialspace=True,
-                engine='c',                 # engine='python' is more versatile, 'c' is faster
-                dtype=str,                  # useful to make some replacements before casting to numeric values
-                skiprows=self.skiprows
-                # verbose=False             # indicates the number of NA values placed in non-numeric columns
-            )
+            reader = pd.read_csv(self._get_csv_source(), engine='c', **kwargs)    # engine='python' is more versatile, 'c' is faster
+            for chunk in reader:
+                yield chunk
+                n_chunks += 1
             lg.info('>> PANDAS using \'c\' engine')
-        except:
-            self.df = pd.read_csv(
-                filepath_or_buffer=self.filepath_or_buffer,
-                comment='#',
-                delimiter=delimiter,
-                skip_blank_lines=True,
-                skipinitialspace=True,
-                engine='python',
-                dtype=str,
-                skiprows=self.skiprows
-                # verbose=False
-            )
+        except ValidationError:
+            raise
+        except Exception:
+            for i, chunk in enumerate(pd.read_csv(self._get_csv_source(), engine='python', **kwargs)):
+                if i >= n_chunks:
+                    yield chunk
             lg.info('>> PANDAS using \'python\' engine')
-        # lg.info('\n\n>> DF: \n\n{}'.format(self.df))
+
+    def _get_csv_source(self):
+        ''' Path or file-like object read by pandas, a new one is needed for each read '''
+        return self.filepath_or_buffer
+
+    def _iter_data_chunks(self, usecols=None):
+        ''' Yields the chunks of data rows with the app column names.
+            The columns names, the units row and the empty columns are checked in the first read.
+            If the units row exists it is removed with the last row of the file (END_DATA in WHP files)
+        '''
+        first_read = self.units_row is None
+        prev = None
+        for i, chunk in enumerate(self._read_csv_chunks(usecols)):
+            if i == 0 and first_read:
+                self._set_col_names(chunk.columns.tolist())
+                self.units_row = self._set_units(chunk.iloc[0].values.tolist()) if chunk.index.size > 0 else False
+            chunk.columns = [self.col_names[c] for c in chunk.columns]
+            if first_read:
+                for c in chunk.columns:
+                    na = (chunk[c].isnull() | chunk[c].str.contains(NA_REGEX, na=False)).all()
+                    self.na_cols[c] = self.na_cols.get(c, True) and bool(na)
+            if i == 0 and self.units_row:
+                chunk = chunk.iloc[1:]
+            if prev is not None:
+                yield prev
+            prev = chunk
+        if prev is not None:
+            yield prev.iloc[:-1] if self.units_row else prev
+
+    def _set_col_names(self, names):
+        ''' Sanitizes and maps the column names of the file to the names used in the app '''
+        new_names = self._map_col_names(self._sanitize_cols(list(names)), list(names))
+        self.raw_col_names = dict(zip(new_names, names))
+        self.col_names = dict(zip(names, new_names))
+
+    def _clean_chunk(self, chunk):
+        ''' Removes the spaces and replaces the -999 values by NaN, column by column '''
+        return pd.DataFrame(
+            {c: self._clean_values(chunk[c]) for c in chunk.columns},
+            index=chunk.index, columns=chunk.columns
+        )
+
+    def _clean_values(self, values):
+        ''' Removes the spaces (\\r and \\n are managed by read_csv) and replaces the -999 values
+            by NaN in a single pass. The values are factorized, so each distinct value is cleaned
+            only once with the compiled regex, and then the cleaned values are taken by code.
+            Before this, two regex replacements were run over all the cells of the DataFrame
+
+                @values - Series with the raw values
+        '''
+        codes, uniques = pd.factorize(values)
+        cleaned = np.empty(len(uniques) + 1, dtype=object)
+        for i, v in enumerate(uniques):
+            if v.__class__ is str:
+                v = self.spaces_regex.sub('', v)
+                if self.na_regex.match(v):
+                    v = np.nan
+            cleaned[i] = v
+        cleaned[-1] = np.nan        # the code -1 is assigned to the NaN values
+        return cleaned.take(codes)
+
+    def _update_col_precision(self, column, values):
+        ''' Updates the maximum number of decimals of the column with the raw values of a chunk.
+            The values are checked in one pass without creating temporary Series or DataFrames.
+            The precision is None while no value with decimal point is found (integer values)
+        '''
+        p = self.col_precisions.get(column)
+        for v in values.values:
+            if v.__class__ is str:                      # NaN values are floats
+                dot = v.rfind('.')
+                if dot != -1 and (p is None or len(v) - dot - 1 > p):
+                    p = len(v) - dot - 1
+        self.col_precisions[column] = p
 
     def _prep_df_columns(self):
-        self.df.replace(r'\s', '', regex=True, inplace=True)  # cleans spaces: \r and \n are managed by read_csv
-        non_sanitized = self.df.columns.tolist()
-        self.df.columns = self._sanitize_cols(self.df.columns.tolist())  # remove spaces from columns
-        self.df.columns = self._map_col_names(self.df.columns.tolist(), non_sanitized)
         self._create_btlnbr_or_sampno_column()  # >> basic params?
         self._manage_date_time()
 
@@ -412,8 +568,8 @@ class CruiseData(CruiseDataExport):
                 'BTLNBR column was automatically generated from the column SAMPNO'
             )
         elif not 'BTLNBR' in self.df and not 'SAMPNO' in self.df:
-            self.df['BTLNBR'] = range(self.df.index.size)
-            self.df['SAMPNO'] = range(self.df.index.size)
+            self.df['BTLNBR'] = pd.to_numeric(range(self.df.index.size), downcast='integer')
+            self.df['SAMPNO'] = pd.to_numeric(range(self.df.index.size), downcast='integer')
             self.add_moves_element(
                 'sampno_btlnbr_columns_added',
                 'BTLNBR, SAMPNO column was automatically generated from the column '
@@ -426,7 +582,10 @@ class CruiseData(CruiseDataExport):
             if 'YEAR' in self.df and 'MONTH' in self.df and 'DAY' in self.df:
                 try:
                     self.df = self.df.assign(
-                        DATE=pd.to_datetime(self.df[['YEAR', 'MONTH', 'DAY']]).dt.strftime('%Y%m%d')
+                        DATE=pd.to_numeric(
+                            pd.to_datetime(self.df[['YEAR', 'MONTH', 'DAY']]).dt.strftime('%Y%m%d'),
+                            downcast='integer'
+                        )
                     )
                 except Exception as e:
                     raise ValidationError(
@@ -533,63 +692,32 @@ class CruiseData(CruiseDataExport):
         return sanitized  # actuallly sanitized and mapped
 
     def _replace_nan_values(self):
-        ''' Replaces the -990.0, -999.00, etc values to NaN.
-            There will be strings and floats in the same column because NaN is considered a float64
-            and this step should be before the numeric conversion
+        ''' Replaces the -990.0, -999.00, etc values of the string columns by NaN.
+            The numeric columns were already cleaned while the file was read
         '''
         lg.info('-- REPLACE MISSING VALUES (-999 >> NaN)')
-        self.df_str = self.df.copy(deep=True)    # TODO: this has to be synchronized when seld.df is updated
-                                                 #       or should not be used anymore
-        self.df.replace(
-            to_replace=NA_REGEX_LIST,
-            value='', #np.nan,
-            inplace=True,
-            regex=True,
-        )
-
-    def _convert_data_to_number(self):
-        ''' Converts the DF from string to numeric values
-            downcasting the resulting data to the smallest numerical dtype possible (int8 is the minimum)
-
-            If the column has float values, all the column will have
-            the same number of decimals (the maximum, zero in the right side is not taking into account)
-
-            If a cell of a column with dtype=np.int8 is assigned to some int64 value, then the column
-            is completely converted to int64
-        '''
-        # treat stations always as strings
-        df_aux = self.df.copy(deep=True)
-        if 'TIME' in df_aux:  # TIME should be string
-            df_aux = df_aux.drop(['TIME'], axis=1)
-        df_aux = df_aux.drop(['STNNBR'], axis=1).apply(lambda x: pd.to_numeric(x, errors='ignore', downcast='integer'))
-        self.df[df_aux.columns] = df_aux
-
-        float_prec_dict = self._set_col_precisions()
-
-        # NOTE: Round each column by the original number of decimal places, if the value is shown somewhere
-        #       or the float comparison, made in cruise_data_update.py, will work better
-        self.df = self.df.round(float_prec_dict)
+        for c in self.df.select_dtypes(include=['object']).columns:
+            self.df[c] = self._clean_values(self.df[c])
 
     def _set_col_precisions(self):
         ''' Set the precision of all the columns in self.cols['precision']
                 * get the columns with float values > precision = X
                 * get the columns with int values   > precision = 0
                 * get the columns with str values   > precision = False
+
+            The number of decimals of each column was computed while the file was read (self.col_precisions)
         '''
         lg.info('-- SET COL PRECISIONS')
         pd_precision = 0
         float_prec_dict = {}
         for c in self.df.select_dtypes(include=['float64']):
             if not self.df[c].isnull().all():
-                df_tmp = self.df_str[c].str.contains(pat='\.', na=False)  # fills na values with False
-                df_tmp = self.df_str[c][df_tmp]
-
-                if df_tmp.index.size == 0:  # are all integer and NaN mixed
+                p = self.col_precisions.get(c)
+                if p is None:  # are all integer and NaN mixed
                     self.cols[c]['precision'] = 0
                     self.cols[c]['data_type'] = 'integer'
                     continue
 
-                p = int(df_tmp.str.rsplit(pat='.', n=1, expand=True)[1].str.len().max())  # always has one '.'
                 if p > pd_precision:
                     pd_precision = p
                 float_prec_dict[c] = p
@@ -599,7 +727,7 @@ class CruiseData(CruiseDataExport):
                 self.cols[c]['precision'] = False
                 self.cols[c]['data_type'] = 'none'
 
-        for c in self.df.select_dtypes(include=['int8', 'int16', 'int32', 'int64']):
+        for c in self.df.select_dtypes(include=['uint8', 'int8', 'int16', 'int32', 'int64']):
             self.cols[c]['precision'] = 0
             if self.df[self.df[c] == 9][c].index.size == self.df.index.size:
                 self.cols[c]['data_type'] = 'integer'
@@ -619,7 +747,10 @@ class CruiseData(CruiseDataExport):
         if pd_precision > 15:
             pd_precision = 15
         pd.set_option('precision', pd_precision)
-        return float_prec_dict
+
+        # NOTE: Round each column by the original number of decimal places, if the value is shown somewhere
+        #       or the float comparison, made in cruise_data_update.py, will work better
+        self.df = self.df.round(float_prec_dict)
 
     def update_flag_values(self, column, new_flag_value, row_indices):
         """ This method is executed mainly when a flag is pressed to update the values
@@ -637,16 +768,18 @@ class CruiseData(CruiseDataExport):
 
         hash_index_list = self.df.index[row_indices]
         self.df.loc[hash_index_list,(column)] = new_flag_value
+        if self.df[column].dtype != FLAG_DTYPE:
+            self.df[column] = self.df[column].astype(FLAG_DTYPE)
 
         if new_flag_value != 9 and empty_column:
             lg.warn(f'>> REMOVING EMPTY ATTR FROM COLUMNS {column}')
-            self.cols[column]['attrs'].remove('empty')
+            self.cols.rmv_attr(column, 'empty')
             self.cols[column]['export'] = True
             self.env.f_handler.set('columns', self.cols, path.join(TMP,'settings.json'))
         elif new_flag_value == 9:
             if 'empty' not in self.cols[column]['attrs'] and self.df[self.df[column] == 9][column].index.size == self.df.index.size:
                 lg.warning(f'>> ADDING EMPTY ATTR TO COLUMN {column}')
-                self.cols[column]['attrs'].append('empty')
+                self.cols.add_attr(column, 'empty')
                 self.cols[column]['export'] = False
                 self.env.f_handler.set('columns', self.cols, path.join(TMP,'settings.json'))
 
@@ -685,8 +818,10 @@ class CruiseData(CruiseDataExport):
         else:
             self.moves.loc[0] = [date, action, '', '', '', '', '', '', '', description]
 
-    def recompute_cps(self):
+    def recompute_cps(self, changes=None):
         ''' Compute all the calculated parameters again. Mainly after a cruise data update
+                @changes - data modified by the update (see CruiseDataUpdate.upd_changes),
+                           only the affected cps are computed again if it is set
 
             NOTE: what should happen if some column cannot be computed?
                   - Check if it is plotted in order to remove the plots?
@@ -696,16 +831,11 @@ class CruiseData(CruiseDataExport):
         cp_params = self.env.cruise_data.get_cols_by_attrs('computed')
         for c in cp_params:
             del self.cols[c]
-        cps_to_rmv = []
-        for c in self.cp_param.proj_settings_cps:
-            if c['param_name'] not in self.cols:  # exclude the computed parameters
-                res = self.cp_param.add_computed_parameter({
-                    'value': c['param_name'],
-                    'prevent_save': True
-                })
-                if res.get('success', False) is False:
-                    if c['param_name'] in self.env.cur_plotted_cols:
-                        cps_to_rmv.append(c['param_name'])
+        failed_cps = self.cp_param.compute_cps(
+            skip=list(self.cols.keys()),   # exclude the computed parameters
+            changes=changes
+        )
+        cps_to_rmv = [c for c in failed_cps if c in self.env.cur_plotted_cols]
         if cps_to_rmv != []:
             self.env.f_handler.remove_cols_from_qc_plot_tabs(cps_to_rmv)
         self._manage_empty_cols()
@@ -729,7 +859,7 @@ class CruiseData(CruiseDataExport):
 
         for c in self.get_cols_by_attrs('flag'):
             if self.df[self.df[c] == 9][c].index.size == self.df.index.size:
-                self.cols[c]['attrs'].append('empty')
+                self.cols.add_attr(c, 'empty')
                 lg.warning(f'>> FLAG: {c} IS MARKED AS EMPTY')
 
                 # NOTE: if the flag has 9 in all the rows means that the param has NaN in all the rows
@@ -738,5 +868,5 @@ class CruiseData(CruiseDataExport):
         # required columns can be nan in order to create the hash_id ??
         for c in self.get_cols_by_attrs(['required']):
             if self.df[c].isnull().all():
-                self.df[c]['attrs'].append('empty')
+                self.cols.add_attr(c, 'empty')
                 lg.warning(f'>> COLUMN: {c} MARKED AS EMPTY')
@@ -41,8 +41,8 @@ class CruiseDataAQC(CruiseData):
     def load_file(self):
         lg.info('-- LOAD FILE AQC >> LOAD FROM FILES')
         self.get_cols_from_settings_file()
-        self._replace_nan_values()         # '-999' >> NaN
-        self._convert_data_to_number()
+        self._set_col_precisions()         # the values were converted to numbers while the file was read
+        self._set_flag_dtypes()
         self._set_hash_ids()
         self._set_cps()
 
@@ -53,14 +53,12 @@ class CruiseDataAQC(CruiseData):
             NOTE: When the file is open the cps are copied from `custom_settings.json`
                   So we have all the CP we need in cps['proj_settings_cps']
                   Also the computed parameters in self.cols is always going to be a subset of the proj_settings_cps
+
+            NOTE: The cps are computed in the dependency graph order, so each intermediate cp
+                  (_SALINITY, _THETA, ...) is computed only once and reused by the rest
+
+            NOTE: The computed columns are stored in the CPS_CACHE folder, out of the project files,
+                  the cps whose equation and input values did not change are loaded from there
         '''
         lg.info('-- SET COMPUTED PARAMETERS')
-        proj_settings_cps = self.cp_param.proj_settings_cps
-        for c in proj_settings_cps:
-            cp_to_compute = {
-                'computed_param_name': c['param_name'],
-                'eq': c['equation'],
-                'precision': c['precision'],
-            }
-            lg.info('>> COMPUTING PARAMETER: {}'.format(c['param_name']))
-            self.cp_param.compute_equation(cp_to_compute)
\ No newline at end of file
+        self.cp_param.compute_cps(add=False, cache_dir=CPS_CACHE)
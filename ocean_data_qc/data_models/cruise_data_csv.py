@@ -90,8 +90,7 @@ class CruiseDataCSV(CruiseData):
         self._set_cols_from_scratch()  # the dataframe has to be created
         self._validate_required_columns()
         self._init_basic_params()
-        self._replace_nan_values()         # '-999' >> NaN
-        self._convert_data_to_number()
+        self._set_col_precisions()         # the values were converted to numbers while the file was read
         self._validate_flag_values()
         self._set_hash_ids()
         self._set_cps()
@@ -107,10 +106,5 @@ class CruiseDataCSV(CruiseData):
                       So we have all the CP we need in cps['proj_settings_cps']
         '''
         lg.info('-- SET COMPUTED PARAMETERS (CSV)')
-        for c in self.cp_param.proj_settings_cps:
-            if c['param_name'] not in self.cols:
-                self.cp_param.add_computed_parameter({
-                    'value': c['param_name'],
-                    'prevent_save': True  # to avoid save_col_attribs all the times, once is enough
-                })
+        self.cp_param.compute_cps(skip=list(self.cols.keys()))  # cols are saved once at the end
         self.save_col_attribs()
@@ -171,10 +171,13 @@ class CruiseDataExport(Environment):
 
     def save_metadata(self):
         lg.info('-- SAVE METADATA')
+        from ocean_data_qc.data_models.cruise_data_whp import WhpFileReader    # NOTE: circular import at module level
+
         if not path.isfile(path.join(TMP, 'metadata')):
             with open(path.join(TMP, 'original.csv'), 'r', errors="ignore") as file:
                 meta = open(path.join(TMP, 'metadata'),'w')
                 for line in file:
+                    line = WhpFileReader.trim_excel_artifacts.sub('', line)    # original.csv is not sanitized
                     if line.startswith('#'):
                         # NOTE: I strip spaces commas and breaklines in order to clean the result
                         #       sometimes excel adds many commas at the end of each line.
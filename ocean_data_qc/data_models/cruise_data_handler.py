@@ -112,20 +112,27 @@ class CruiseDataHandler(Environment):
         return True
 
     def _is_whp_format(self, csv_path=None):
-        ''' Open the file and checks if comply to the WHP format requirements '''
-
+        ''' Checks if the file comply to the WHP format requirements.
+            Only the first line and the end of the file are read
+        '''
         if path.isfile(csv_path):
-            with open(csv_path, 'rt', encoding="ascii", errors="surrogateescape") as f:
-                raw_data = f.read()
+            with open(csv_path, 'rb') as f:
+                head = f.read(len('BOTTLE'))
+                f.seek(0, 2)
+                f.seek(max(0, f.tell() - 1024))
+                tail = f.read()
         else:
             raise FileNotFoundError('The file was not found: {}'.format(csv_path))
+        head = head.decode('ascii', errors='surrogateescape')
+        tail = tail.decode('ascii', errors='surrogateescape').replace('\r\n', '\n').replace('\r', '\n')
 
-        if raw_data.startswith('BOTTLE'):
-            if raw_data.endswith('END_DATA'):
+        if head.startswith('BOTTLE'):
+            tail_lines = tail.split('\n')
+            if tail.endswith('END_DATA'):
                 return True
-            elif raw_data.split('\n')[-1].startswith('END_DATA'):
+            elif tail_lines[-1].startswith('END_DATA'):
                 return True     # has weird end_data
-            elif raw_data.split('\n')[-2].startswith('END_DATA'):
+            elif len(tail_lines) > 1 and tail_lines[-2].startswith('END_DATA'):
                 return True     # has weird end_data 2
 
     def compare_data(self):
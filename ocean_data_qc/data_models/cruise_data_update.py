@@ -58,6 +58,14 @@ class CruiseDataUpdate(Environment):
         # VALUES
         self.diff_val_qty = 0
         self.diff_val_pairs = []
+
+        # APPLIED CHANGES (used to recompute only the affected computed parameters)
+        self.upd_changes = {
+            'cols': [],             # added or removed columns, all the rows are affected
+            'add_rows': [],         # hash ids of the added rows
+            'rmv_rows': False,      # whether some row was removed
+            'values': {},           # {'COLUMN': [hash_id_1, hash_id_2, ...]}
+        }
         self._compute_comparison()
 
     def _compute_comparison(self):
@@ -133,87 +141,86 @@ class CruiseDataUpdate(Environment):
     def _compute_values_comparison(self):
         """ Comparison of values between both DF
             If there are removed rows or columns the values comparison is not possible
-            So I need the intersections of rows and columns to make sure that they exist in both df """
+            So I need the intersections of rows and columns to make sure that they exist in both df
+
+            Both DF are aligned once by the HASH_ID index and each column is compared in bulk,
+            instead of comparing the values cell by cell
+        """
         lg.info('-- COMPUTE VALUES COMPARISON')
         RESET_FLAG_VALUE = 2
-        columns = list(
-            frozenset(
-                self.env.cd_aux.get_cols_by_attrs(self.cols_to_compare)
-            ).intersection(
-                self.env.cruise_data.get_cols_by_attrs(self.cols_to_compare)
-            )
-        )
+        cd_df = self.env.cruise_data.df
+        aux_df = self.env.cd_aux.df
 
-        new_hash_id_list = self.env.cd_aux.df.index.tolist()
-        old_has_id_list = self.env.cruise_data.df.index.tolist()
-        hash_ids_rows = list(frozenset(old_has_id_list).intersection(new_hash_id_list))
-
-        for hash_id in hash_ids_rows:
-            for column in columns:
-                new_scalar = self.env.cd_aux.df.loc[hash_id, column]
-                old_scalar = self.env.cruise_data.df.loc[hash_id, column]
-                # TODO: make it with strings self.env.cruise_data.df_str == self.env.cruise_data.df_str
-                #       how to calculate the hash ids?
-
-                # and if they are new_scalar = 'str' and old_scalar = NaN ?????
-                nan_different = False
-                if isinstance(new_scalar, str) or isinstance(old_scalar, str):
-                    if not isinstance(new_scalar, str) and isinstance(old_scalar, str):
-                        nan_different = True
-                    if isinstance(new_scalar, str) and not isinstance(old_scalar, str):
-                        nan_different = True
-                elif ((not np.isnan(new_scalar) and np.isnan(old_scalar)) or (np.isnan(new_scalar) and not np.isnan(old_scalar))):
-                    nan_different = True
-
-                if not self._are_equal(new_scalar, old_scalar):
-                    if nan_different or (isinstance(new_scalar, str) and isinstance(old_scalar, str)) or not (np.isnan(new_scalar) and np.isnan(old_scalar)):
-                        if (hash_id, column) not in self.diff_val_pairs: # is this possible?
-                            self.diff_val_qty += 1
-                            self.diff_val_pairs.append((hash_id, column))
-                            lg.info('>> POS: ({}, {}) - NEW VALUE: {} - OLD VALUE: {}'.format(
-                                hash_id, column, new_scalar, old_scalar
-                            ))
-
-                        # the column flag has to be reset by default
-                        # unless the whole flag column was added or the flag cell was modified
-                        if column in self.env.cruise_data.get_cols_by_attrs(['param']):
-                            flag_column = column + FLAG_END
-                            if flag_column in self.env.cruise_data.get_cols_by_attrs(['flag']):
-                                if (hash_id, flag_column) not in self.diff_val_pairs:
-                                    if flag_column in self.env.cd_aux.get_cols_by_attrs('flag'):
-                                        if flag_column not in self.add_cols:
-                                            if self.env.cd_aux.df.loc[hash_id, flag_column] != RESET_FLAG_VALUE:
-                                                self.diff_val_qty += 1
-                                                self.diff_val_pairs.append((hash_id, column))
-                                                self.env.cd_aux.df.loc[hash_id, flag_column] = RESET_FLAG_VALUE
-                                                lg.info('>> FLAG RESET POS: HASH: {} FLAG COLUMN: {}'.format(
-                                                    hash_id, flag_column
-                                                ))
-
-    def _are_equal(self, val1, val2):
-        # lg.info('-- VALUE COMPARISON')
-        # Numpy types: https://docs.scipy.org/doc/numpy/user/basics.types.html
-
-        # TODO: compare only strings
-
-        if isinstance(val1, (str)) and isinstance(val1, (str)):
-            return val1 == val2
-
-        np_int = (np.int8, np.int16, np.int32, np.int64)
-        if isinstance(val1, np_int) and isinstance(val1, np_int):
-            return val1 == val2
-
-        eps64 = np.finfo(np.float64).eps
-        # if np.absolute(val1 - val2) < eps64:    # the same as np.isclose()
-        equal = np.isclose(
-            np.array([val1], dtype=np.float64),  # cast to float64
-            np.array([val2], dtype=np.float64),
-            equal_nan=False,
-            atol=0.0,
-            rtol=eps64
-        )[0]
-
-        return equal
+        aux_cols = self.env.cd_aux.get_cols_by_attrs(self.cols_to_compare)
+        columns = [
+            c for c in self.env.cruise_data.get_cols_by_attrs(self.cols_to_compare)
+            if c in aux_cols
+        ]
+        hash_ids = cd_df.index.intersection(aux_df.index)
+        if len(columns) == 0 or hash_ids.size == 0:
+            return
+
+        old_df = cd_df.loc[hash_ids, columns]
+        new_df = aux_df.loc[hash_ids, columns]
+        diff_masks = {}
+        for column in columns:
+            diff_masks[column] = self._get_diff_mask(old_df[column], new_df[column])
+
+        # NOTE: np.nonzero returns the positions ordered by row, and by column within each row
+        diff_rows, diff_cols = np.nonzero(np.column_stack([diff_masks[c] for c in columns]))
+        self.diff_val_pairs = [(hash_ids[r], columns[c]) for r, c in zip(diff_rows, diff_cols)]
+        self.diff_val_qty = len(self.diff_val_pairs)
+        for column in columns:
+            n_diff = np.count_nonzero(diff_masks[column])
+            if n_diff > 0:
+                lg.info('>> COLUMN: {} - DIFFERENT VALUES: {}'.format(column, n_diff))
+
+        # the column flag has to be reset by default
+        # unless the whole flag column was added or the flag cell was modified
+        cd_params = self.env.cruise_data.get_cols_by_attrs(['param'])
+        cd_flags = self.env.cruise_data.get_cols_by_attrs(['flag'])
+        aux_flags = self.env.cd_aux.get_cols_by_attrs(['flag'])
+        for column in columns:
+            flag_column = column + FLAG_END
+            if (
+                column in cd_params and flag_column in cd_flags and flag_column in aux_flags
+                and flag_column not in self.add_cols
+            ):
+                reset_mask = diff_masks[column] & (
+                    aux_df.loc[hash_ids, flag_column].to_numpy() != RESET_FLAG_VALUE
+                )
+                if flag_column in diff_masks:
+                    reset_mask &= ~diff_masks[flag_column]
+                if reset_mask.any():
+                    reset_hash_ids = hash_ids[reset_mask]
+                    aux_df.loc[reset_hash_ids, flag_column] = RESET_FLAG_VALUE
+                    self.diff_val_qty += reset_hash_ids.size
+                    self.diff_val_pairs.extend([(h, column) for h in reset_hash_ids])
+                    lg.info('>> FLAG RESET: FLAG COLUMN: {} | ROWS: {}'.format(
+                        flag_column, reset_hash_ids.size
+                    ))
+
+    def _get_diff_mask(self, old_col, new_col):
+        """ Returns a boolean array with True where the values of both aligned columns are different
+                * NaN values are equal between them, but they are different from any other value
+                * numeric columns are compared as float64 with the float64 epsilon as relative tolerance
+                * other columns (strings) are compared directly
+        """
+        old_nan = old_col.isnull().to_numpy()
+        new_nan = new_col.isnull().to_numpy()
+        both_values = ~old_nan & ~new_nan
+        if old_col.dtype.kind in 'biuf' and new_col.dtype.kind in 'biuf':
+            eps64 = np.finfo(np.float64).eps
+            equal = np.isclose(
+                new_col.to_numpy(dtype=np.float64),
+                old_col.to_numpy(dtype=np.float64),
+                equal_nan=False,
+                atol=0.0,
+                rtol=eps64
+            )
+        else:
+            equal = new_col.to_numpy(dtype=object) == old_col.to_numpy(dtype=object)
+        return (old_nan != new_nan) | (both_values & ~equal)
 
     def get_different_values(self):
         """ Structure of the different_values dictionary:
@@ -342,32 +349,43 @@ class CruiseDataUpdate(Environment):
             )
 
         self.env.cruise_data._replace_nan_values()     # -999 >> NaN
+        self.env.cruise_data._set_flag_dtypes()        # NaN >> 9 in new rows and columns can upcast them
+        self.env.cruise_data.reset_stt_index()         # the pressures may have been updated
 
         self._update_moves()
         self.env.cruise_data.save_tmp_data()
         self._reset_update_env()
 
     def _update_rows(self, add_rows_checked=False, rmv_rows_checked=False):
+        """ The new rows are appended and the removed rows are dropped
+            with one single operation each one, aligned by the HASH_ID index
+        """
         lg.info('-- Updating rows')
-        if add_rows_checked is True and self.add_rows_hash_list != []:
-            for hash_id in self.add_rows_hash_list:
-                cd_aux_columns = self.env.cd_aux.get_cols_by_attrs(self.cols_to_compare)
-                cd_columns = self.env.cruise_data.get_cols_by_attrs(self.cols_to_compare)
-                columns = list(frozenset(cd_aux_columns).intersection(cd_columns))
-                self.env.cruise_data.df.loc[hash_id, columns] = self.env.cd_aux.df.loc[hash_id, columns].tolist()
-
-                # NOTE: when there is a new row but we do not have value in the flag column: NaN >> 9
-                cd_aux_flag_columns = self.env.cd_aux.get_cols_by_attrs(['flag'])
-                cd_flag_columns = self.env.cruise_data.get_cols_by_attrs(['flag'])
-                flag_cols = [col for col in cd_flag_columns if col not in cd_aux_flag_columns]
-                self.env.cruise_data.df.loc[hash_id, flag_cols] = 9
-
-            lg.info('>> Rows added: {}'.format(list(self.add_rows_hash_list)))
-
-        if rmv_rows_checked is True and self.rmv_rows_hash_list != []:
-            for hash_id in self.rmv_rows_hash_list:
-                self.env.cruise_data.df = self.env.cruise_data.df.drop(hash_id)  # assignation needed
+        cd_df = self.env.cruise_data.df
+        if add_rows_checked is True and len(self.add_rows_hash_list) > 0:
+            cd_aux_columns = self.env.cd_aux.get_cols_by_attrs(self.cols_to_compare)
+            cd_columns = self.env.cruise_data.get_cols_by_attrs(self.cols_to_compare)
+            columns = [c for c in cd_columns if c in cd_aux_columns]
+
+            # NOTE: keep the row order of the new file
+            add_hash_ids = [h for h in self.env.cd_aux.df.index if h in self.add_rows_hash_list]
+            new_rows = self.env.cd_aux.df.loc[add_hash_ids, columns].reindex(columns=cd_df.columns)
+
+            # NOTE: when there is a new row but we do not have value in the flag column: NaN >> 9
+            cd_aux_flag_columns = self.env.cd_aux.get_cols_by_attrs(['flag'])
+            cd_flag_columns = self.env.cruise_data.get_cols_by_attrs(['flag'])
+            flag_cols = [col for col in cd_flag_columns if col not in cd_aux_flag_columns]
+            new_rows[flag_cols] = 9
+
+            cd_df = pd.concat([cd_df, new_rows])
+            self.upd_changes['add_rows'] = add_hash_ids
+            lg.info('>> Rows added: {}'.format(add_hash_ids))
+
+        if rmv_rows_checked is True and len(self.rmv_rows_hash_list) > 0:
+            cd_df = cd_df.drop(list(self.rmv_rows_hash_list))
+            self.upd_changes['rmv_rows'] = True
             lg.info('>> Rows removed: {}'.format(list(self.rmv_rows_hash_list)))
+        self.env.cruise_data.df = cd_df
 
     def _update_columns(self, add_cols_checked=False, rmv_cols_checked=False):
         """ It updates the old_data object adding or removing columns
@@ -378,19 +396,22 @@ class CruiseDataUpdate(Environment):
         # I have to add the columns manually because other way I cannot assign the units well in the right position
         if add_cols_checked is True or rmv_cols_checked is True:
             if add_cols_checked is True and self.add_cols != []:
+                # NOTE: the values are aligned by the HASH_ID index, the rows that do not exist
+                #       in the new file get NaN values, or 9 if it is a flag column
+                new_cols_df = self.env.cd_aux.df[self.add_cols].reindex(self.env.cruise_data.df.index)
                 for column in self.add_cols:
-                    self.env.cruise_data.cols[column] = self.env.cd_aux.cols[column]      # TODO: is it copied the full element or only a reference?
-
-                    # TODO: update values per hash_id one by one, because they may have different rows
                     if column[-7:] == FLAG_END:
-                        self.env.cruise_data.df[column] = self.env.cruise_data.df.index.size * [9]
-                    else:
-                        self.env.cruise_data.df[column] = self.env.cruise_data.df.index.size * [np.nan]
-                    self.env.cruise_data._add_column(column)  # if the column is a flag column is already marked inside
+                        new_cols_df[column] = pd.to_numeric(
+                            new_cols_df[column].fillna(9), downcast='integer'
+                        )
+                cd_df = self.env.cruise_data.df
+                cd_df = cd_df.drop(columns=cd_df.columns.intersection(self.add_cols))  # overwritten, the labels must be unique
+                self.env.cruise_data.df = pd.concat([cd_df, new_cols_df], axis=1)
+                self.upd_changes['cols'] += self.add_cols
 
-                    for i in self.env.cruise_data.df.index.tolist():  # copy all the cell elements one by one
-                        if i in self.env.cd_aux.df.index:
-                            self.env.cruise_data.df.loc[i, column] = self.env.cd_aux.df.loc[i, column]
+                for column in self.add_cols:
+                    self.env.cruise_data.cols[column] = self.env.cd_aux.cols[column]      # TODO: is it copied the full element or only a reference?
+                    self.env.cruise_data._add_column(column)  # if the column is a flag column is already marked inside
 
             if rmv_cols_checked is True and self.rmv_cols != []:
                 col_flag_rmv = []
@@ -429,6 +450,7 @@ class CruiseDataUpdate(Environment):
 
                 # lg.warning('>> SELF.RMV_COLS: {}'.format(self.rmv_cols))
                 self.env.f_handler.remove_cols_from_qc_plot_tabs(self.rmv_cols)
+                self.upd_changes['cols'] += self.rmv_cols
 
                 # FIXME: for some reason the SILCAT_FLAG_W is correctly remove from some places but I get key error
                 #        >> check if the layout is loaded well again
@@ -437,9 +459,14 @@ class CruiseDataUpdate(Environment):
         """ update the values in the self.env.cruise_data object with the new ones
             the flag associated to the columns has to be reset """
         lg.info('-- UPDATING VALUES')
+        upd_values = self.upd_changes['values']
         if diff_val_qty is True:  # update all the values
             for hash_id, column in self.diff_val_pairs:
-                self.env.cruise_data.df.loc[hash_id, column] = self.env.cd_aux.df.loc[hash_id, column]
+                upd_values.setdefault(column, []).append(hash_id)
+            for column in upd_values:   # one assignment per column
+                hash_ids = list(dict.fromkeys(upd_values[column]))   # NOTE: the pairs of the reset flags can be repeated
+                upd_values[column] = hash_ids
+                self.env.cruise_data.df.loc[hash_ids, column] = self.env.cd_aux.df.loc[hash_ids, column].to_numpy()
         else:
             if diff_values != {} and diff_values is not False:
                 for param in diff_values:
@@ -448,9 +475,11 @@ class CruiseDataUpdate(Environment):
                             lg.info('>> STT ELEM: {}'.format(elem))
                             if elem['param_checked'] is True:
                                 self.env.cruise_data.df.loc[elem['hash_id'], param] = self.env.cd_aux.df.loc[elem['hash_id'], param]
+                                upd_values.setdefault(param, []).append(elem['hash_id'])
                             if elem['flag_checked'] is True:
                                 flag = param + '_FLAG_W'
                                 self.env.cruise_data.df.loc[elem['hash_id'], flag] = self.env.cd_aux.df.loc[elem['hash_id'], flag]
+                                upd_values.setdefault(flag, []).append(elem['hash_id'])
 
     def _update_moves(self):
         """ The log of actions is updated with the new operations """
@@ -488,7 +517,7 @@ class CruiseDataUpdate(Environment):
         for c in self.env.cruise_data.get_cols_by_attrs('param'):
             self.env.cruise_data.create_missing_flag_col(c)
         self.env.cruise_data.cp_param = ComputedParameter()
-        self.env.cruise_data.recompute_cps()
+        self.env.cruise_data.recompute_cps(changes=self.upd_changes)
         if self.modified is True:
             if path.isfile(path.join(TMP, 'original.old.csv')):
                 os.remove(path.join(TMP, 'original.old.csv'))  # previous old file stored as history
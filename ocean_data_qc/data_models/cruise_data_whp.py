@@ -14,6 +14,106 @@ import csv
 import re
 
 
+class WhpFileReader(object):
+    ''' File-like object used by pandas to read the WHP files. The file is read only once,
+        line by line, and only the cleaned data rows are given to pandas:
+
+            * the ugly excel artifacts (spaces and quotes at the beginning of the lines
+              and empty lines) are removed
+            * the first line (BOTTLE,...) and the comments are skipped
+            * the lines after END_DATA are discarded
+            * the number of fields of each row is checked against the header
+
+        The original file is not modified.
+    '''
+    trim_excel_artifacts = re.compile(r'^[\s"]*')
+
+    def __init__(self, f_path, rollback='cd'):
+        self.f_path = f_path
+        self.rollback = rollback
+        self.lines = self._get_lines()
+        self.buf = ''
+
+    def _get_lines(self):
+        with open(self.f_path, 'r', errors='surrogateescape') as f:
+            first_len = -1
+            for row_number, line in enumerate(f, start=1):
+                if row_number == 1:                 # BOTTLE,...
+                    continue
+                line = self.trim_excel_artifacts.sub('', line)
+                if line == '' or line.startswith('#'):
+                    continue
+                if line.startswith('END_DATA'):
+                    yield 'END_DATA\n'
+                    return
+                if not line.endswith('\n'):
+                    line += '\n'
+                if first_len == -1:
+                    row = next(csv.reader([line], delimiter=',', quotechar='"'))
+                    if '' in row:
+                        raise ValidationError(
+                            'Some header column name is missing: FILE ROW = {} | COL = {}'.format(
+                                row_number, row.index('') + 1
+                            ),
+                            rollback='cd'
+                        )
+                    first_len = len(row)
+                else:
+                    if '"' in line:
+                        n_fields = len(next(csv.reader([line], delimiter=',', quotechar='"')))
+                    else:
+                        n_fields = line.count(',') + 1
+                    if first_len != n_fields:    # TODO: empty fields in the csv should be filled by NaN values
+                        raise ValidationError(
+                            'There is an invalid number of fields ({}) in the row: {}.'
+                            ' The number of header columns fields is: {}'.format(
+                                n_fields, row_number, first_len
+                            ),
+                            rollback=self.rollback
+                        )
+                yield line
+
+    def read(self, size=-1):
+        parts = [self.buf]
+        length = len(self.buf)
+        for line in self.lines:
+            parts.append(line)
+            length += len(line)
+            if size >= 0 and length >= size:
+                break
+        data = ''.join(parts)
+        if size < 0:
+            self.buf = ''
+            return data
+        self.buf = data[size:]
+        return data[:size]
+
+    def readline(self):
+        if self.buf != '':
+            line, sep, rest = self.buf.partition('\n')
+            if sep == '':
+                return line + self.readline_from_lines()
+            self.buf = rest
+            return line + sep
+        return self.readline_from_lines()
+
+    def readline_from_lines(self):
+        self.buf = ''
+        return next(self.lines, '')
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if line == '':
+            raise StopIteration
+        return line
+
+    def close(self):
+        self.lines.close()
+
+
 class CruiseDataWHP(CruiseData):
     ''' This class use to manage the plain CSV files (with WHP format)
     '''
@@ -28,71 +128,25 @@ class CruiseDataWHP(CruiseData):
         self.rollback = 'cd' if cd_aux is False else 'cd_update'
         self.working_dir = working_dir
         self.filepath_or_buffer = path.join(working_dir, 'original.csv')
-        self.skiprows = 1
-        self._sanitize_original_csv()
+        self.skiprows = 0               # the BOTTLE line is skipped by WhpFileReader
         super(CruiseDataWHP, self).__init__(original_type='whp', cd_aux=cd_aux)
         self.load_file()
 
-    def _sanitize_original_csv(self):
-        try:
-            lg.info('-- TRYING TO SANITIZE UGLY EXCEL ARTIFACTS IN WHP FILES')
-            with open(self.filepath_or_buffer, 'r', errors='surrogateescape') as f:
-                trim_excel_artifacts = re.compile(r'[\n\r][\s\"]*')
-                buf = trim_excel_artifacts.sub('\n', f.read())
-                buf = re.sub(r'[\n\r]END_DATA[\s\S]*', '\nEND_DATA', buf)
-            with open(self.filepath_or_buffer, 'w', errors='surrogateescape') as f:
-                f.write(buf)
-        except Exception as e:
-            raise ValidationError(
-                'Error trying to sanitize ugly excel artifacts in WHP files: {}'.format(e),
-                rollback=self.rollback
-            )
-
     def _validate_original_data(self):               # TODO: this should be in each cruise data class
-        ''' Checks if all the rows have the same number of elements '''
-        lg.info('-- CHECK DATA FORMAT (WHP)')
-        with open(self.filepath_or_buffer, newline='', errors='surrogateescape') as csvfile:
-            spamreader = csv.reader(csvfile, delimiter=',', quotechar='"')          # TODO: ignore comments with #
-            first_len = -1
-            row_number = 1
-            header = True
-            trim_excel_artifacts = re.compile(r'^[\s\"]*')
-            for row in spamreader:
-                row[0] = trim_excel_artifacts.sub('', row[0])
-                if not(row[0].startswith('BOTTLE') or row[0].startswith('END_DATA') or row[0].startswith('#')):
-                    if header is True and '' in row:
-                        csvfile.close()
-                        raise ValidationError(
-                            'Some header column name is missing: FILE ROW = {} | COL = {}'.format(
-                                row_number, row.index('') + 1
-                            ),
-                            rollback='cd'
-                        )
-                        break                               # interrupt for loop
-                    if header is True:
-                        header = False
-                    if first_len == -1:
-                        first_len = len(row)
-                    else:
-                        if first_len != len(row):    # TODO: empty fields in the csv should be filled by NaN values
-                            csvfile.close()
-                            raise ValidationError(
-                                'There is an invalid number of fields ({}) in the row: {}.'
-                                ' The number of header columns fields is: {}'.format(
-                                    len(row), row_number, first_len
-                                ),
-                                rollback=self.rollback
-                            )
-                            break                               # interrupt for loop
-                row_number += 1
+        ''' The number of elements of the rows are checked by WhpFileReader
+            while the file is read, so the file is read only once
+        '''
+        lg.info('-- CHECK DATA FORMAT (WHP) >> WHILE THE FILE IS READ')
+
+    def _get_csv_source(self):
+        return WhpFileReader(self.filepath_or_buffer, rollback=self.rollback)
 
     def load_file(self):
         lg.info('-- LOAD FILE WHP >> FROM SCRATCH')
         self._set_cols_from_scratch()  # the dataframe has to be created
         self._validate_required_columns()
         self._init_basic_params()
-        self._replace_nan_values()         # '-999' >> NaN
-        self._convert_data_to_number()
+        self._set_col_precisions()         # the values were converted to numbers while the file was read
         self._validate_flag_values()
         self._set_hash_ids()
         self._set_cps()
@@ -108,10 +162,5 @@ class CruiseDataWHP(CruiseData):
                       So we have all the CP we need in cps['proj_settings_cps']
         '''
         lg.info('-- SET COMPUTED PARAMETERS (WHP)')
-        for c in self.cp_param.proj_settings_cps:
-            if c['param_name'] not in self.cols:
-                self.cp_param.add_computed_parameter({
-                    'value': c['param_name'],
-                    'prevent_save': True  # to avoid save_col_attribs all the times, once is enough
-                })
+        self.cp_param.compute_cps(skip=list(self.cols.keys()))  # cols are saved once at the end
         self.save_col_attribs()
\ No newline at end of file
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#    License, authors, contributors and copyright information at:       #
+#    AUTHORS and LICENSE files at the root folder of this application   #
+#########################################################################
+
+from bokeh.util.logconfig import bokeh_logger as lg
+from ocean_data_qc.constants import *
+
+import ast
+import re
+import numpy as np
+import pandas as pd
+
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None   # NOTE: the arithmetic is evaluated with NumPy then
+
+
+class UnsupportedEquation(Exception):
+    ''' The equation should be evaluated with DataFrame.eval(engine='python') '''
+    pass
+
+
+class EquationEvaluator(object):
+    ''' Evaluates the equations of the computed parameters on whole NumPy arrays.
+
+        The equation is parsed into an AST once. The arithmetic subtrees are evaluated
+        with numexpr (multi-threaded) and the sandbox functions (seawater, octave, ...)
+        are called with the whole columns, as DataFrame.eval(engine='python') does.
+        For example, in the equation
+
+            @satO2(_SALINITY, _THETA) / (22.414 * @dens(_SALINITY, _THETA, 0) * 1E-6) - _OXYGEN
+
+        satO2 and dens are called once and the rest is evaluated by numexpr as
+
+            __call_0 / (22.414 * __call_1 * 1E-6) - _OXYGEN
+
+        NOTE: If the equation has any other element (attributes, comparisons, unknown names, ...)
+              UnsupportedEquation is raised and the python engine should be used instead
+    '''
+    BIN_OPS = {
+        ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/',
+        ast.Pow: '**', ast.Mod: '%', ast.FloorDiv: '//',
+    }
+    UNARY_OPS = {ast.USub: '-', ast.UAdd: '+'}
+    LOCAL_PREFIX = '__local_'
+    NE_DTYPES = ('int32', 'int64', 'float32', 'float64')    # other types (uint8 flags) are upcast by numexpr
+
+    def __init__(self, funcs={}):
+        self.funcs = funcs
+        self.compiled = {}      # {equation: (src, variables)}
+
+    def evaluate(self, eq, df):
+        ''' Returns the result of the equation computed with the columns of df
+                @eq - equation without the assignment, the ${PARAM} should be already replaced
+        '''
+        if eq not in self.compiled:
+            self.compiled[eq] = self._compile(eq, df)
+        src, variables = self.compiled[eq]
+        return self._evaluate_expr(src, variables, df)
+
+    def _compile(self, eq, df):
+        eq = re.sub(r'@([a-zA-Z_][a-zA-Z0-9_]*)', self.LOCAL_PREFIX + r'\1', eq)
+        try:
+            tree = ast.parse(eq, mode='eval')
+        except SyntaxError:
+            raise UnsupportedEquation('Syntax error in the equation: {}'.format(eq))
+        counter = [0]
+        return self._compile_node(tree.body, df, counter)
+
+    def _compile_node(self, node, df, counter):
+        ''' Returns a tuple (src, variables) where src is an arithmetic expression
+            and variables is a dictionary with the values used in it:
+                {'COLUMN': ('col', 'COLUMN'), '__call_0': ('call', func, [(src, variables), ...])}
+        '''
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            return repr(node.value), {}
+        if isinstance(node, ast.Name):
+            if node.id in df.columns and not node.id.startswith(self.LOCAL_PREFIX):
+                return node.id, {node.id: ('col', node.id)}
+            raise UnsupportedEquation('Unknown name: {}'.format(node.id))
+        if isinstance(node, ast.BinOp) and type(node.op) in self.BIN_OPS:
+            left_src, left_vars = self._compile_node(node.left, df, counter)
+            right_src, right_vars = self._compile_node(node.right, df, counter)
+            left_vars.update(right_vars)
+            return '({} {} {})'.format(left_src, self.BIN_OPS[type(node.op)], right_src), left_vars
+        if isinstance(node, ast.UnaryOp) and type(node.op) in self.UNARY_OPS:
+            src, variables = self._compile_node(node.operand, df, counter)
+            return '({}{})'.format(self.UNARY_OPS[type(node.op)], src), variables
+        if (
+            isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+            and node.func.id.startswith(self.LOCAL_PREFIX) and node.keywords == []
+        ):
+            func = self.funcs.get(node.func.id[len(self.LOCAL_PREFIX):], None)
+            if func is None:
+                raise UnsupportedEquation('Unknown function: {}'.format(node.func.id))
+            args = [self._compile_node(arg, df, counter) for arg in node.args]
+            name = '__call_{}'.format(counter[0])
+            counter[0] += 1
+            return name, {name: ('call', func, args)}
+        raise UnsupportedEquation('Unsupported element: {}'.format(ast.dump(node)))
+
+    def _evaluate_expr(self, src, variables, df):
+        if src in variables:    # a single column or function call, the value is returned as it is
+            return self._get_value(variables[src], df)
+        if variables == {}:     # the number is assigned to all the rows, as DataFrame.eval does
+            return eval(src, {'__builtins__': {}}, {})
+        arrays = {}
+        for name, var in variables.items():
+            arr = np.asarray(self._get_value(var, df))
+            if arr.ndim == 2 and arr.shape[1] == 1:
+                arr = arr[:, 0]
+            if arr.shape != (df.index.size, ) or arr.dtype.kind not in 'biuf':
+                raise UnsupportedEquation('The value of {} cannot be used in the arithmetic'.format(name))
+            arrays[name] = arr
+        if (
+            ne is not None and '//' not in src      # NOTE: numexpr does not support floor division
+            and all(arr.dtype.name in self.NE_DTYPES for arr in arrays.values())
+        ):
+            try:
+                return ne.evaluate(src, local_dict=arrays)
+            except Exception as e:
+                raise UnsupportedEquation('numexpr could not evaluate the equation: {}'.format(e))
+        return eval(src, {'__builtins__': {}}, arrays)
+
+    def _get_value(self, var, df):
+        if var[0] == 'col':
+            return df[var[1]]
+        func, args = var[1], var[2]
+        values = []
+        for src, variables in args:
+            if variables == {}:     # constants are sent as python numbers
+                values.append(eval(src, {'__builtins__': {}}, {}))
+            elif src in variables:
+                values.append(self._get_value(variables[src], df))
+            else:
+                values.append(pd.Series(self._evaluate_expr(src, variables, df), index=df.index))
+        return func(*values)
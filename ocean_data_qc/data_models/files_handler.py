@@ -14,6 +14,7 @@ from more_itertools import unique_everseen
 from os import path
 import os
 import json
+import copy
 import shutil
 from hashlib import md5
 from jinja2 import Template
@@ -52,11 +53,16 @@ class FilesHandler(Environment):
     ''' Mainly this manages all the JSON files.
         TODO: Move all the asyncronous tasks on Electron with files to this file if possible
         TODO: the config file could be here as well
+
+        NOTE: The content of the JSON files is kept in memory and only parsed again if the
+              modification time or the size of the file change (Electron writes them as well).
+              The values are written to the file and to the memory at the same time
     '''
     env = Environment
 
     def __init__(self):
         self.env.f_handler = self
+        self.json_cache = {}        # {f_path: {'stamp': (mtime_ns, size), 'content': {}, 'cols_by_attr': {}}}
 
     def load_data(self):
         lg.info('-- LOAD DATA (FilesHandler class)')
@@ -98,10 +104,9 @@ class FilesHandler(Environment):
         '''
         self.graphs = []
         if path.isfile(path.join(TMP, 'settings.json')):
-            with open(path.join(TMP, 'settings.json'), 'r') as f:
-                config = json.load(f,  object_pairs_hook=OrderedDict)
+            config = self._read_json(path.join(TMP, 'settings.json'))
             if 'qc_plot_tabs' in config:
-                self.env.qc_plot_tabs = config.get('qc_plot_tabs', False)
+                self.env.qc_plot_tabs = OrderedDict(copy.deepcopy(config.get('qc_plot_tabs', False)))
                 cols = []
                 i = 0
                 for tab in self.env.qc_plot_tabs:
@@ -125,26 +130,22 @@ class FilesHandler(Environment):
         '''
         lg.info('-- REMOVE COLS FROM QC PLOT TABS. REMOVING: {}'.format(cols))
         if cols != [] and path.isfile(path.join(TMP, 'settings.json')):
-            config = {}
-            tabs = {}
-            with open(path.join(TMP, 'settings.json'), 'r') as f:
-                config = json.load(f,  object_pairs_hook=OrderedDict)
-                if 'qc_plot_tabs' in config:
-                    tabs = config.get('qc_plot_tabs', False)
-                    tabs_to_rmv = []
-                    for tab in tabs:
-                        graphs_to_rmv = []
-                        for graph in tabs[tab]:
-                            if graph.get('x', '') in cols or graph.get('y', '') in cols:
-                                graphs_to_rmv.append(graph)
-                        for g in graphs_to_rmv:
-                            tabs[tab].remove(g)
-                        if tabs[tab] == []:  # if all the plot of some tab were removed
-                            tabs_to_rmv.append(tab)
-                    for t in tabs_to_rmv:
-                        del tabs[t]   # >> take into account that here config is also updated
-            with open(path.join(TMP, 'settings.json'), 'w') as f:
-                json.dump(config, f, indent=4, sort_keys=True)
+            config = copy.deepcopy(self._read_json(path.join(TMP, 'settings.json')))
+            if 'qc_plot_tabs' in config:
+                tabs = config.get('qc_plot_tabs', False)
+                tabs_to_rmv = []
+                for tab in tabs:
+                    graphs_to_rmv = []
+                    for graph in tabs[tab]:
+                        if graph.get('x', '') in cols or graph.get('y', '') in cols:
+                            graphs_to_rmv.append(graph)
+                    for g in graphs_to_rmv:
+                        tabs[tab].remove(g)
+                    if tabs[tab] == []:  # if all the plot of some tab were removed
+                        tabs_to_rmv.append(tab)
+                for t in tabs_to_rmv:
+                    del tabs[t]   # >> take into account that here config is also updated
+            self._write_json(path.join(TMP, 'settings.json'), config)
 
     @property
     def graphs_per_tab(self):
@@ -167,40 +168,66 @@ class FilesHandler(Environment):
         lg.info('-- GET LAYOUT SETTINGS')
         ly_settings = {}
         if path.isfile(path.join(TMP, 'settings.json')):
-            with open(path.join(TMP, 'settings.json'), 'r') as f:
-                config = json.load(f)
-                if 'layout' in config:
-                    ly = config.get('layout', False)
-                    ly_settings['ncols'] = ly.get('plots_per_row', 3)
-                    ly_settings['plot_width'] = ly.get('plots_width', 400)
-                    ly_settings['plot_height'] = ly.get('plots_height', 400)
+            config = self._read_json(path.join(TMP, 'settings.json'))
+            if 'layout' in config:
+                ly = config.get('layout', False)
+                ly_settings['ncols'] = ly.get('plots_per_row', 3)
+                ly_settings['plot_width'] = ly.get('plots_width', 400)
+                ly_settings['plot_height'] = ly.get('plots_height', 400)
         return ly_settings if ly_settings != {} else False
 
     def _load_settings(self):
         ''' Load some settings into object attributes '''
         if path.isfile(path.join(TMP, 'settings.json')):
-            with open(path.join(TMP, 'settings.json'), 'r') as f:
-                config = json.load(f)
-                if 'layout' in config:
-                    ly = config.get('layout', False)
-                    if ly is not False:
-                        self.env.show_titles = ly.get('titles')
+            config = self._read_json(path.join(TMP, 'settings.json'))
+            if 'layout' in config:
+                ly = config.get('layout', False)
+                if ly is not False:
+                    self.env.show_titles = ly.get('titles')
 
     def remove_tmp_folder(self):
         lg.warning('-- REMOVE TMP FOLDER')
         shutil.rmtree(TMP)
+        self.json_cache = {}
+
+    def _read_json(self, f_path):
+        ''' Returns the content of the JSON file, it is only parsed again if the file changed.
+            NOTE: the returned object is shared, it must not be modified
+        '''
+        st = os.stat(f_path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        entry = self.json_cache.get(f_path)
+        if entry is None or entry['stamp'] != stamp:
+            with open(f_path, 'r') as f:
+                entry = {'stamp': stamp, 'content': json.load(f), 'cols_by_attr': None}
+            self.json_cache[f_path] = entry
+        return entry['content']
+
+    def _write_json(self, f_path, json_content):
+        ''' Writes the content to the file and keeps a copy in memory '''
+        with open(f_path, 'w') as fp:
+            json.dump(json_content, fp, indent=4, sort_keys=True)
+        st = os.stat(f_path)
+        self.json_cache[f_path] = {
+            'stamp': (st.st_mtime_ns, st.st_size),
+            'content': copy.deepcopy(json_content),
+            'cols_by_attr': None,
+        }
 
-    def get(self, attr, f_path):
+    def get(self, attr, f_path, deep_copy=False):
         """ Gets data from json files
             * attr: attribute to get
             * f_path: file path where the file is located
+            * deep_copy: whether to return a copy of the value, if the caller is going to modify it
 
-            NOTE: This method should be avoided because access to hard disk is very costly
+            NOTE: The file is only read again if it was modified. Without deep_copy
+                  the returned value is shared with the cache, it must not be modified
         """
         # lg.info('-- GET ATTR: {} | FROM FILE: {}'.format(attr, f_path))
-        with open(f_path, 'r') as f:
-            json_content = json.load(f)
+        json_content = self._read_json(f_path)
         if attr in json_content:
+            if deep_copy:
+                return copy.deepcopy(json_content[attr])
             return json_content[attr]
         else:
             lg.warning(f'>> The attribute {attr} is not in the JSON file: {f_path}')
@@ -211,12 +238,11 @@ class FilesHandler(Environment):
             * value: new value to set
             * f_path: file path where the file is located
         '''
-        with open(f_path, 'r') as f:
-            json_content = json.load(f)
+        json_content = self._read_json(f_path)
         if attr in json_content:
+            json_content = dict(json_content)
             json_content[attr] = value
-            with open(f_path, 'w') as fp:
-                json.dump(json_content, fp, indent=4, sort_keys=True)
+            self._write_json(f_path, json_content)
         else:
             lg.warning(f'>> The attribute {attr} is not in the JSON file: {f_path}')
 
@@ -226,16 +252,18 @@ class FilesHandler(Environment):
               * required
               * non_qc_param
 
-              TODO: this is called many times, try to access to disk less by storing the
-                    content of columns somewhere (it just has to be updated when the user modify it)
+              The lists of all the attributes are built at once the first time
+              and they are built again only if the file is modified
         '''
-        cols = self.get('columns', CUSTOM_SETTINGS) or {}
-        l = []
-        for c in cols:
-            if attr in cols[c]['attrs']:
-                l.append(c)
-        l = sorted(l)
-        return l
+        json_content = self._read_json(CUSTOM_SETTINGS)
+        entry = self.json_cache[CUSTOM_SETTINGS]
+        if entry['cols_by_attr'] is None:
+            cols_by_attr = {}
+            for c, col in (json_content.get('columns') or {}).items():
+                for a in col['attrs']:
+                    cols_by_attr.setdefault(a, []).append(c)
+            entry['cols_by_attr'] = {a: sorted(l) for a, l in cols_by_attr.items()}
+        return list(entry['cols_by_attr'].get(attr, []))
 
 class BokehTemplate(Template):
     def render(self, *args, **kwargs):
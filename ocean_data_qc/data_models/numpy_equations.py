@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#    License, authors, contributors and copyright information at:       #
+#    AUTHORS and LICENSE files at the root folder of this application   #
+#########################################################################
+
+import numpy as np
+
+from bokeh.util.logconfig import bokeh_logger as lg
+from ocean_data_qc.constants import *
+
+
+class NumpyEquations(object):
+    ''' NumPy ports of the closed-form octave equations (aou_gg.m and the CO2SYS.m wrappers).
+        They return the same shape as the octave functions, one column with one row per sample.
+
+        The CO2SYS ports only cover the options used by the wrappers in the octave folder:
+            * TEMPIN = TEMPOUT = 25 and PRESIN = PRESOUT = 0 (no pressure corrections)
+            * K1K2CONSTANTS = 10 (Lueker et al, 2000)
+            * KSO4CONSTANTS = 1 (KSO4 of Dickson & TB of Uppstrom 1979)
+
+        NOTE: The ports are used if the 'numpy' backend is selected (eq_backend in shared_data.json).
+              They are compared with the reference values of the octave wrappers in tests/
+    '''
+
+    def aou_gg(self, SAL, THETA, OXY):
+        ''' Apparent oxygen utilization with the oxygen saturation of Garcia and Gordon (1992) in umol/kgSW '''
+        S = np.asarray(SAL, dtype=float)
+        T = np.asarray(THETA, dtype=float)
+        OXY = np.asarray(OXY, dtype=float)
+
+        A0, A1, A2, A3, A4, A5 = 5.80871, 3.20291, 4.17887, 5.10006, -9.86643E-02, 3.80369
+        B0, B1, B2, B3 = -7.01577E-03, -7.70028E-03, -1.13864E-02, -9.51519E-03
+        C0 = -2.75915E-07
+
+        Ts = np.log((298.15 - T) / (273.15 + T))
+        lnC0 = (
+            A0 + A1 * Ts + A2 * Ts ** 2 + A3 * Ts ** 3 + A4 * Ts ** 4 + A5 * Ts ** 5
+            + S * (B0 + B1 * Ts + B2 * Ts ** 2 + B3 * Ts ** 3)
+            + C0 * S ** 2
+        )
+        return (np.exp(lnC0) - OXY).reshape(-1, 1)
+
+    def tcarbn_from_alkali_phsws25p0(self, ALKALI, PH_SWS, SAL, SILCAT, PHSPHT):
+        return self._co2sys(ALKALI, PH_SWS, SAL, SILCAT, PHSPHT, par2_type='ph', ph_scale=2)
+
+    def tcarbn_from_alkali_phts25p0(self, ALKALI, PH_TOT, SAL, SILCAT, PHSPHT):
+        return self._co2sys(ALKALI, PH_TOT, SAL, SILCAT, PHSPHT, par2_type='ph', ph_scale=1)
+
+    def phts25p0_from_alkali_tcarbn(self, ALKALI, TCARBN, SAL, SILCAT, PHSPHT):
+        return self._co2sys(ALKALI, TCARBN, SAL, SILCAT, PHSPHT, par2_type='tc', ph_scale=2)
+
+    def _co2sys(self, ALKALI, PAR2, SAL, SILCAT, PHSPHT, par2_type='ph', ph_scale=2):
+        ''' Computes only the rows without NaN values, as the octave wrappers do
+                @par2_type - 'ph': returns TCO2 (umol/kgSW) from TAlk and pH (CO2SYS column 2)
+                             'tc': returns pH on the total scale from TAlk and TCO2 (CO2SYS column 37)
+                @ph_scale - pH scale of the constants and the input pH: 1 (Total) or 2 (Seawater)
+        '''
+        data = np.column_stack([
+            np.asarray(x, dtype=float) for x in (ALKALI, PAR2, SAL, SILCAT, PHSPHT)
+        ])
+        ret = np.full(data.shape[0], np.nan)
+        F = ~np.isnan(data).any(axis=1)
+        if F.any():
+            TA = data[F, 0] / 1e6
+            Sal = data[F, 2]
+            k = self._co2sys_constants(Sal, data[F, 3] / 1e6, data[F, 4] / 1e6, ph_scale)
+            if par2_type == 'ph':
+                ret[F] = self._tc_from_ta_ph(TA, data[F, 1], k) * 1e6
+            else:
+                pH = self._ph_from_ta_tc(TA, data[F, 1] / 1e6, k)
+                factor = 0.0 if ph_scale == 1 else -np.log(k['SWStoTOT']) / np.log(0.1)
+                ret[F] = pH - factor
+        return ret.reshape(-1, 1)
+
+    def _co2sys_constants(self, Sal, TSi, TP, ph_scale, TempC=25.0):
+        ''' Port of the Constants subroutine of CO2SYS.m. At 0 dbar the pressure factors are 1 '''
+        TempK = TempC + 273.15
+        logTempK = np.log(TempK)
+        sqrSal = np.sqrt(Sal)
+
+        TB = 0.0004157 * Sal / 35                                # Uppstrom, 1974
+        TF = (0.000067 / 18.998) * (Sal / 1.80655)               # Riley, 1965
+        TS = (0.14 / 96.062) * (Sal / 1.80655)                   # Morris & Riley, 1966
+        IonS = 19.924 * Sal / (1000 - 1.005 * Sal)
+
+        # KS: Dickson, 1990. On the free pH scale in mol/kg-SW
+        lnKS = (
+            -4276.1 / TempK + 141.328 - 23.093 * logTempK
+            + (-13856 / TempK + 324.57 - 47.986 * logTempK) * np.sqrt(IonS)
+            + (35474 / TempK - 771.54 + 114.723 * logTempK) * IonS
+            + (-2698 / TempK) * np.sqrt(IonS) * IonS + (1776 / TempK) * IonS ** 2
+        )
+        KS = np.exp(lnKS) * (1 - 0.001005 * Sal)
+
+        # KF: Dickson & Riley, 1979. On the free pH scale in mol/kg-SW
+        lnKF = 1590.2 / TempK - 12.641 + 1.525 * IonS ** 0.5
+        KF = np.exp(lnKF) * (1 - 0.001005 * Sal)
+
+        SWStoTOT = (1 + TS / KS) / (1 + TS / KS + TF / KF)
+
+        # KB: Dickson, 1990. Converted from the total to the SWS pH scale
+        lnKBtop = -8966.9 - 2890.53 * sqrSal - 77.942 * Sal + 1.728 * sqrSal * Sal - 0.0996 * Sal ** 2
+        lnKB = (
+            lnKBtop / TempK + 148.0248 + 137.1942 * sqrSal + 1.62142 * Sal
+            + (-24.4344 - 25.085 * sqrSal - 0.2474 * Sal) * logTempK + 0.053105 * sqrSal * TempK
+        )
+        KB = np.exp(lnKB) / SWStoTOT
+
+        # KW: Millero, 1995. On the SWS pH scale
+        lnKW = (
+            148.9802 - 13847.26 / TempK - 23.6521 * logTempK
+            + (-5.977 + 118.67 / TempK + 1.0495 * logTempK) * sqrSal - 0.01615 * Sal
+        )
+        KW = np.exp(lnKW)
+
+        # KP1, KP2, KP3, KSi: Yao and Millero, 1995. On the SWS pH scale
+        KP1 = np.exp(
+            -4576.752 / TempK + 115.54 - 18.453 * logTempK
+            + (-106.736 / TempK + 0.69171) * sqrSal + (-0.65643 / TempK - 0.01844) * Sal
+        )
+        KP2 = np.exp(
+            -8814.715 / TempK + 172.1033 - 27.927 * logTempK
+            + (-160.34 / TempK + 1.3566) * sqrSal + (0.37335 / TempK - 0.05778) * Sal
+        )
+        KP3 = np.exp(
+            -3070.75 / TempK - 18.126 + (17.27039 / TempK + 2.81197) * sqrSal
+            + (-44.99486 / TempK - 0.09984) * Sal
+        )
+        lnKSi = (
+            -8904.2 / TempK + 117.4 - 19.334 * logTempK + (-458.79 / TempK + 3.5913) * np.sqrt(IonS)
+            + (188.74 / TempK - 1.5998) * IonS + (-12.1652 / TempK + 0.07871) * IonS ** 2
+        )
+        KSi = np.exp(lnKSi) * (1 - 0.001005 * Sal)
+
+        # K1, K2: Lueker et al, 2000. Converted from the total to the SWS pH scale
+        pK1 = 3633.86 / TempK - 61.2172 + 9.6777 * np.log(TempK) - 0.011555 * Sal + 0.0001152 * Sal ** 2
+        K1 = 10 ** -pK1 / SWStoTOT
+        pK2 = 471.78 / TempK + 25.929 - 3.16967 * np.log(TempK) - 0.01781 * Sal + 0.0001122 * Sal ** 2
+        K2 = 10 ** -pK2 / SWStoTOT
+
+        # the constants are put on the chosen pH scale, KS and KF stay on the free scale
+        pHfactor = SWStoTOT if ph_scale == 1 else 1.0
+        return {
+            'K1': K1 * pHfactor, 'K2': K2 * pHfactor, 'KW': KW * pHfactor, 'KB': KB * pHfactor,
+            'KP1': KP1 * pHfactor, 'KP2': KP2 * pHfactor, 'KP3': KP3 * pHfactor, 'KSi': KSi * pHfactor,
+            'KS': KS, 'KF': KF, 'TB': TB, 'TF': TF, 'TS': TS, 'TP': TP, 'TSi': TSi,
+            'SWStoTOT': SWStoTOT,
+        }
+
+    def _alk_parts(self, H, k):
+        ''' Alkalinity contributions of borate, water, phosphate, silicate and the
+            acid species (HSO4, HF and free H) for the hydrogen ion concentration H
+        '''
+        BAlk = k['TB'] * k['KB'] / (k['KB'] + H)
+        OH = k['KW'] / H
+        PhosTop = k['KP1'] * k['KP2'] * H + 2 * k['KP1'] * k['KP2'] * k['KP3'] - H * H * H
+        PhosBot = H * H * H + k['KP1'] * H * H + k['KP1'] * k['KP2'] * H + k['KP1'] * k['KP2'] * k['KP3']
+        PAlk = k['TP'] * PhosTop / PhosBot
+        SiAlk = k['TSi'] * k['KSi'] / (k['KSi'] + H)
+        FREEtoTOT = 1 + k['TS'] / k['KS']
+        Hfree = H / FREEtoTOT
+        HSO4 = k['TS'] / (1 + k['KS'] / Hfree)
+        HF = k['TF'] / (1 + k['KF'] / Hfree)
+        return BAlk, OH, PAlk, SiAlk, Hfree, HSO4, HF
+
+    def _tc_from_ta_ph(self, TA, pH, k):
+        ''' Port of CalculateTCfromTApH '''
+        H = 10 ** -pH
+        BAlk, OH, PAlk, SiAlk, Hfree, HSO4, HF = self._alk_parts(H, k)
+        CAlk = TA - BAlk - OH - PAlk - SiAlk + Hfree + HSO4 + HF
+        return CAlk * (H * H + k['K1'] * H + k['K1'] * k['K2']) / (k['K1'] * (H + 2 * k['K2']))
+
+    def _ph_from_ta_tc(self, TA, TC, k):
+        ''' Port of CalculatepHfromTATC, Newton's method starting at pH = 8.
+            All the samples are iterated until all of them converge, as in CO2SYS.m
+        '''
+        pH_tol = 0.0001
+        ln10 = np.log(10)
+        K1, K2 = k['K1'], k['K2']
+        pH = np.full(TA.shape, 8.0)
+        delta_pH = np.full(TA.shape, pH_tol + 1)
+        while np.any(np.abs(delta_pH) > pH_tol):
+            H = 10 ** -pH
+            Denom = H * H + K1 * H + K1 * K2
+            CAlk = TC * K1 * (H + 2 * K2) / Denom
+            BAlk, OH, PAlk, SiAlk, Hfree, HSO4, HF = self._alk_parts(H, k)
+            Residual = TA - CAlk - BAlk - OH - PAlk - SiAlk + Hfree + HSO4 + HF
+            # the slope dTA/dpH is not exact, but keeps all important terms
+            Slope = ln10 * (
+                TC * K1 * H * (H * H + K1 * K2 + 4 * H * K2) / Denom / Denom
+                + BAlk * H / (k['KB'] + H) + OH + H
+            )
+            delta_pH = Residual / Slope
+            while np.any(np.abs(delta_pH) > 1):     # to keep the jump from being too big
+                big = np.abs(delta_pH) > 1
+                delta_pH[big] = delta_pH[big] / 2
+            pH = pH + delta_pH
+        return pH
@@ -14,11 +14,20 @@ import pandas as pd
 import numpy as np
 import seawater as sw
 import importlib
+import importlib.util
+import subprocess as sbp
+import atexit
+import tempfile
+import uuid
+from hashlib import md5
+from concurrent.futures import ThreadPoolExecutor
 from scipy import stats
 
 from bokeh.util.logconfig import bokeh_logger as lg
 from ocean_data_qc.constants import *
 from ocean_data_qc.env import Environment
+from ocean_data_qc.data_models.exceptions import ValidationError
+from ocean_data_qc.data_models.numpy_equations import NumpyEquations
 
 
 class OctaveEquations(Environment):
@@ -28,8 +37,11 @@ class OctaveEquations(Environment):
             * equations that can be used by octave
 
         NOTE: If one new method is added to this class, its string name should be
-              added to the ComputedParameter class as well. This is to prevent from adding
+              added to CP_NON_EQUATION_METHODS as well. This is to prevent from adding
               it to the local context (local_dict)
+
+        NOTE: octave is not run when the path is set. It is detected once for each path
+              and started in the background the first time an equation needs it
     '''
     env = Environment
 
@@ -38,8 +50,17 @@ class OctaveEquations(Environment):
         self.env.oct_eq = self
 
         self.oc = None
+        self.oc_future = None       # global octave session, started in the background when it is needed
+        self.oct_versions = {}      # {oct_exe_path: version or False}, octave is run only once for each path
+        self.oc_pool = None         # warm octave sessions used to compute the heavy equations in parallel
+        self.oct2py_lib = None
+        self.oc_mmap = True         # whether the arrays are sent to octave with raw binary files
+        self.canyonb_cache = {}     # outputs of the last CANYON-B call
+        self.np_eq = NumpyEquations()
         self.oct_exe_path = False
         self.set_oct_exe_path()
+        self._load_eq_backend()
+        atexit.register(self._close_oc_pool)
 
     def guess_oct_exe_path(self):
         lg.info('-- GUESS OCT EXE PATH')
@@ -107,17 +128,245 @@ class OctaveEquations(Environment):
                     self.oct_exe_path = path
 
         if self.oct_exe_path is not False:
+            if not os.path.isfile(self.oct_exe_path):
+                lg.warning('>> OCTAVE EXECUTABLE NOT FOUND: {}'.format(self.oct_exe_path))
+                return {'octave_path': False }
             os.environ['OCTAVE_EXECUTABLE'] = self.oct_exe_path
-            try:
-                oct2py_lib = importlib.import_module('oct2py')
-                self.oc = oct2py_lib.octave
-                self.oc.addpath(os.path.join(OCEAN_DATA_QC_PY, 'octave'))
-                self.oc.addpath(os.path.join(OCEAN_DATA_QC_PY, 'octave', 'CANYON-B'))
+            self._close_oc_pool()
+            if importlib.util.find_spec('oct2py') is not None:
                 return {'octave_path': self.oct_exe_path }
-            except Exception as e:
-                lg.error('>> oct2py LIBRARY COULD NOT BE IMPORTED, OCTAVE PATH WAS NOT SET CORRECTLY')
+            lg.error('>> oct2py LIBRARY COULD NOT BE IMPORTED, OCTAVE PATH WAS NOT SET CORRECTLY')
         return {'octave_path': False }
 
+    def is_octave_available(self):
+        ''' Whether the octave equations can be used. Octave is not run here,
+            if it was not detected yet for the current path only the executable file is checked
+        '''
+        if self.oct_exe_path in (False, None, ''):
+            return False
+        if self.oct_exe_path in self.oct_versions:
+            return self.oct_versions[self.oct_exe_path] is not False
+        return os.path.isfile(self.oct_exe_path)
+
+    def start_octave(self):
+        ''' Starts the global octave session in the background if it is not started yet
+                @return - future with the octave session
+        '''
+        if self.oc_future is None:
+            executor = ThreadPoolExecutor(max_workers=1)
+            self.oc_future = executor.submit(self._start_octave)
+            executor.shutdown(wait=False)
+        return self.oc_future
+
+    def _start_octave(self):
+        if self._detect_octave() is False:
+            raise ValidationError('Octave was not detected in the path: {}'.format(self.oct_exe_path))
+        lg.info('-- STARTING OCTAVE')
+        oct2py_lib = importlib.import_module('oct2py')
+        self.oct2py_lib = oct2py_lib
+        oc = oct2py_lib.octave
+        oc.addpath(os.path.join(OCEAN_DATA_QC_PY, 'octave'))
+        oc.addpath(os.path.join(OCEAN_DATA_QC_PY, 'octave', 'CANYON-B'))
+        return oc
+
+    def _detect_octave(self):
+        ''' Runs octave only once for each executable path
+                @return - octave version or False if it could not be run
+        '''
+        oct_exe_path = self.oct_exe_path
+        if oct_exe_path not in self.oct_versions:
+            oc_output = sbp.getstatusoutput('{} --eval "OCTAVE_VERSION"'.format(oct_exe_path))
+            if oc_output[0] == 0:
+                version = oc_output[1].split('=')[1].strip()
+                lg.info('>> OCTAVE DETECTED FROM PYTHON, VERSION: {}'.format(version))
+            else:
+                lg.warning('>> OCTAVE UNDETECTED')
+                version = False
+            self.oct_versions[oct_exe_path] = version
+        return self.oct_versions[oct_exe_path]
+
+    def _get_oc(self):
+        ''' Returns the global octave session, waiting for it if it is still starting '''
+        if self.oc is None:
+            try:
+                self.oc = self.start_octave().result()
+            except Exception:
+                self.oc_future = None   # NOTE: it is tried again in the next call
+                raise
+        return self.oc
+
+    def set_eq_backend(self, args={}):
+        ''' Selects the backend of the equations that have a NumPy port
+                @args - {'eq_backend': 'numpy' | 'octave'}
+        '''
+        lg.info('-- SET EQ BACKEND')
+        eq_backend = args.get('eq_backend', 'octave')
+        if eq_backend not in ('numpy', 'octave'):
+            lg.warning('>> UNKNOWN EQUATION BACKEND: {}'.format(eq_backend))
+            eq_backend = 'octave'
+        self.env.eq_backend = eq_backend
+        try:
+            self.env.f_handler.set('eq_backend', eq_backend, SHARED_DATA)
+        except Exception as e:
+            lg.warning('>> THE EQUATION BACKEND COULD NOT BE STORED: {}'.format(e))
+        return {'eq_backend': eq_backend}
+
+    def _load_eq_backend(self):
+        ''' Sets the backend stored in shared_data.json, octave is used if it is not set '''
+        try:
+            eq_backend = self.env.f_handler.get('eq_backend', SHARED_DATA)
+        except Exception:
+            eq_backend = None
+        if eq_backend in ('numpy', 'octave'):
+            self.env.eq_backend = eq_backend
+        lg.info('>> EQUATION BACKEND: {}'.format(self.env.eq_backend))
+
+    def _start_oc_session(self):
+        oc = self.oct2py_lib.Oct2Py()
+        oc.addpath(os.path.join(OCEAN_DATA_QC_PY, 'octave'))
+        oc.addpath(os.path.join(OCEAN_DATA_QC_PY, 'octave', 'CANYON-B'))
+        return oc
+
+    def _get_oc_pool(self):
+        ''' Returns the list of warm octave sessions, they are started the first time
+            with the octave folders already added to the path. The first one is the global session
+        '''
+        if self.oc_pool is None:
+            self.oc_pool = [self._get_oc()]
+            n_workers = min(os.cpu_count() or 1, OCT_POOL_SIZE) - 1
+            if n_workers > 0:
+                lg.info('-- STARTING {} OCTAVE WORKERS'.format(n_workers))
+                with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                    futures = [executor.submit(self._start_oc_session) for i in range(n_workers)]
+                for f in futures:
+                    try:
+                        self.oc_pool.append(f.result())
+                    except Exception as e:
+                        lg.warning('>> AN OCTAVE WORKER COULD NOT BE STARTED: {}'.format(e))
+        return self.oc_pool
+
+    def _close_oc_pool(self):
+        if self.oc_pool is not None:
+            for oc in self.oc_pool[1:]:
+                try:
+                    oc.exit()
+                except Exception:
+                    pass
+            self.oc_pool = None
+        self.oc = None
+        self.oc_future = None
+
+    def _oc_call(self, func_name, data, axis=0, args=()):
+        ''' Calls the octave function with the data split in chunks along the axis of the samples.
+            Each chunk is computed in a different octave session at the same time,
+            the samples are independent of each other in all the octave equations
+
+                @func_name - name of the octave function
+                @data - 2D array with the input values
+                @axis - axis of the samples in data (0: one row per sample)
+                @args - extra string arguments sent to the octave function
+        '''
+        n_samples = data.shape[axis]
+        n_chunks = n_samples // OCT_CHUNK_MIN_SAMPLES
+        if n_chunks < 2:
+            return self._oc_exec(self._get_oc(), func_name, data, args)
+        pool = self._get_oc_pool()
+        n_chunks = min(n_chunks, len(pool))
+        if n_chunks < 2:
+            return self._oc_exec(self._get_oc(), func_name, data, args)
+
+        chunks = np.array_split(data, n_chunks, axis=axis)
+        with ThreadPoolExecutor(max_workers=n_chunks) as executor:
+            futures = [
+                executor.submit(self._oc_exec, oc, func_name, chunk, args)
+                for oc, chunk in zip(pool, chunks)
+            ]
+        results = [np.asarray(f.result()) for f in futures]
+
+        # NOTE: the results are joined along the axis where the samples are
+        res_axis = 0
+        if results[0].ndim == 2 and results[0].shape[0] != chunks[0].shape[axis]:
+            res_axis = 1
+        return np.concatenate(results, axis=res_axis)
+
+    def _oc_exec(self, oc, func_name, data, args=()):
+        ''' Runs the octave function in the session oc. The input and output matrices are
+            written as raw doubles in files of the shared memory folder (the temp folder
+            if it does not exist), and octave reads them directly with fread/fwrite.
+            This avoids the MAT serialization of oct2py, which is used if the files fail
+
+            NOTE: the errors of the octave function (Oct2PyError) are raised as they are
+        '''
+        if not self.oc_mmap or data.ndim != 2:
+            return getattr(oc, func_name)(data, *args)
+        shm_dir = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        name = uuid.uuid4().hex
+        in_path = os.path.join(shm_dir, 'aqc_oct_in_{}.bin'.format(name))
+        out_path = os.path.join(shm_dir, 'aqc_oct_out_{}.bin'.format(name))
+        try:
+            try:
+                with open(in_path, 'wb') as f:
+                    np.array(data.shape, dtype=np.float64).tofile(f)
+                    data.astype(np.float64).ravel(order='F').tofile(f)   # NOTE: octave matrices are column-major
+            except OSError as e:
+                lg.warning('>> THE INPUT ARRAY COULD NOT BE WRITTEN, USING OCT2PY SERIALIZATION: {}'.format(e))
+                return getattr(oc, func_name)(data, *args)
+            oc.eval(
+                "aqc_fid = fopen('{i}', 'r'); aqc_sz = fread(aqc_fid, 2, 'double')'; "
+                "aqc_x = fread(aqc_fid, aqc_sz, 'double'); fclose(aqc_fid); "
+                "aqc_y = double({f}(aqc_x{a})); aqc_fid = fopen('{o}', 'w'); "
+                "fwrite(aqc_fid, size(aqc_y), 'double'); fwrite(aqc_fid, aqc_y, 'double'); fclose(aqc_fid); "
+                "clear aqc_fid aqc_sz aqc_x aqc_y;".format(
+                    i=in_path, o=out_path, f=func_name, a=''.join(", '{}'".format(a) for a in args)
+                ),
+                nout=0
+            )
+            try:
+                values = np.fromfile(out_path, dtype=np.float64)
+                shape = tuple(int(x) for x in values[:2])
+                return values[2:].reshape(shape, order='F')
+            except (OSError, ValueError) as e:
+                lg.warning('>> THE OUTPUT ARRAY COULD NOT BE READ, USING OCT2PY SERIALIZATION: {}'.format(e))
+                return getattr(oc, func_name)(data, *args)
+        finally:
+            for f_path in [in_path, out_path]:
+                if os.path.isfile(f_path):
+                    os.remove(f_path)
+
+    def _canyonb(self, func_name, data):
+        ''' All the CANYON-B outputs used by the project computed parameters are computed
+            with one single call the first time any of them is requested. The results are
+            kept for the rest of the CANYON-B functions called with the same input matrix
+
+                @func_name - name of the CANYON-B equation, see CANYONB_PARAMS
+                @data - input matrix (DATE, LATITUDE, LONGITUDE, PRES, CTDTMP, SAL, OXY)
+        '''
+        key = md5(data.tobytes() + str(data.shape).encode()).hexdigest()
+        if self.canyonb_cache.get('key') != key or func_name not in self.canyonb_cache['values']:
+            funcs = self._get_project_canyonb_funcs()
+            if func_name not in funcs:
+                funcs.append(func_name)
+            lg.info('>> COMPUTING CANYON-B OUTPUTS: {}'.format(funcs))
+            values = self._oc_call(
+                'nncanyonb_bit18', data, args=(','.join([CANYONB_PARAMS[f] for f in funcs]), )
+            )
+            values = np.asarray(values).reshape(data.shape[0], len(funcs))
+            self.canyonb_cache = {
+                'key': key,
+                'values': {f: values[:, [i]] for i, f in enumerate(funcs)}
+            }
+        return self.canyonb_cache['values'][func_name]
+
+    def _get_project_canyonb_funcs(self):
+        ''' Returns the CANYON-B equations used by the project computed parameters '''
+        try:
+            equations = ' '.join([
+                cp.get('equation', '') for cp in self.env.cruise_data.cp_param.proj_settings_cps
+            ])
+        except Exception:
+            return []
+        return [f for f in CANYONB_PARAMS if '{}('.format(f) in equations]
+
     def pressure_combined(self, CTDPRS, DEPTH, LATITUDE):
         pressure = -1 * CTDPRS
         #pres_from_depth = sw.pres(DEPTH, LATITUDE)
@@ -243,50 +492,58 @@ class OctaveEquations(Environment):
         return ret
 
     def aou_gg(self, SAL, THETA, OXY):
-        ret = self.oc.aou_gg(np.transpose(np.vstack((SAL, THETA, OXY))))
+        if self.env.eq_backend == 'numpy':
+            return self.np_eq.aou_gg(SAL, THETA, OXY)
+        ret = self._oc_call('aou_gg', np.transpose(np.vstack((SAL, THETA, OXY))))
         return ret
 
     def tcarbn_from_alkali_phsws25p0(self, ALKALI, PH_SWS, SAL, SILCAT, PHSPHT):
-        ret = self.oc.tcarbn_from_alkali_phsws25p0(np.transpose(np.vstack((ALKALI, PH_SWS, SAL, SILCAT, PHSPHT))))
+        if self.env.eq_backend == 'numpy':
+            return self.np_eq.tcarbn_from_alkali_phsws25p0(ALKALI, PH_SWS, SAL, SILCAT, PHSPHT)
+        ret = self._oc_call('tcarbn_from_alkali_phsws25p0', np.transpose(np.vstack((ALKALI, PH_SWS, SAL, SILCAT, PHSPHT))))
         return ret
 
     def tcarbn_from_alkali_phts25p0(self, ALKALI, PH_TOT, SAL, SILCAT, PHSPHT):
-        ret = self.oc.tcarbn_from_alkali_phts25p0(np.transpose(np.vstack((ALKALI, PH_TOT, SAL, SILCAT, PHSPHT))))
+        if self.env.eq_backend == 'numpy':
+            return self.np_eq.tcarbn_from_alkali_phts25p0(ALKALI, PH_TOT, SAL, SILCAT, PHSPHT)
+        ret = self._oc_call('tcarbn_from_alkali_phts25p0', np.transpose(np.vstack((ALKALI, PH_TOT, SAL, SILCAT, PHSPHT))))
         return ret
 
     def phts25p0_from_alkali_tcarbn(self, ALKALI, TCARBN, SAL, SILCAT, PHSPHT):
-        ret = self.oc.phts25p0_from_alkali_tcarbn(np.transpose(np.vstack((ALKALI, TCARBN, SAL, SILCAT, PHSPHT))))
+        if self.env.eq_backend == 'numpy':
+            return self.np_eq.phts25p0_from_alkali_tcarbn(ALKALI, TCARBN, SAL, SILCAT, PHSPHT)
+        ret = self._oc_call('phts25p0_from_alkali_tcarbn', np.transpose(np.vstack((ALKALI, TCARBN, SAL, SILCAT, PHSPHT))))
         return ret
 
     def alkali_nng2_vel13(self, LONGITUDE, LATITUDE, DPTH, THETA, SAL, NITRAT, PHSPHT, SILCAT, OXY):
-        ret = np.transpose(self.oc.alkali_nng2_vel13(
-            np.vstack((LONGITUDE, LATITUDE, -1 * DPTH, THETA, SAL, NITRAT, PHSPHT, SILCAT, OXY))))
+        ret = np.transpose(self._oc_call(
+            'alkali_nng2_vel13', np.vstack((LONGITUDE, LATITUDE, -1 * DPTH, THETA, SAL, NITRAT, PHSPHT, SILCAT, OXY)), axis=1))
         return ret
 
     def alkali_nngv2_bro19(self, LONGITUDE, LATITUDE, DPTH, THETA, SAL, NITRAT, PHSPHT, SILCAT, OXY):
-        ret = np.transpose(self.oc.alkali_nngv2_bro19(
-            np.vstack((LATITUDE, np.cos(np.deg2rad(LONGITUDE)), np.sin(np.deg2rad(LONGITUDE)), -1 * DPTH, THETA, SAL, PHSPHT, NITRAT, SILCAT, OXY))))
+        ret = np.transpose(self._oc_call(
+            'alkali_nngv2_bro19', np.vstack((LATITUDE, np.cos(np.deg2rad(LONGITUDE)), np.sin(np.deg2rad(LONGITUDE)), -1 * DPTH, THETA, SAL, PHSPHT, NITRAT, SILCAT, OXY)), axis=1))
         return ret
 
     def tcarbn_nngv2ldeo_bro20(self, LONGITUDE, LATITUDE, DPTH, THETA, SAL, NITRAT, PHSPHT, SILCAT, OXY, YEAR):
-        ret = np.transpose(self.oc.tcarbn_nngv2ldeo_bro20(
-            np.vstack((LATITUDE, np.cos(np.deg2rad(LONGITUDE)), np.sin(np.deg2rad(LONGITUDE)), -1 * DPTH, THETA, SAL, PHSPHT, NITRAT, SILCAT, OXY, YEAR))))
+        ret = np.transpose(self._oc_call(
+            'tcarbn_nngv2ldeo_bro20', np.vstack((LATITUDE, np.cos(np.deg2rad(LONGITUDE)), np.sin(np.deg2rad(LONGITUDE)), -1 * DPTH, THETA, SAL, PHSPHT, NITRAT, SILCAT, OXY, YEAR)), axis=1))
         return ret
 
     def nitrat_nncanyonb_bit18(self, DATE, LATITUDE, LONGITUDE, PRES, CTDTMP, SAL, OXY):
-        return self.oc.nitrat_nncanyonb_bit18(np.transpose(np.vstack((DATE.to_numpy() // 10000, LATITUDE, LONGITUDE, -1 * PRES, CTDTMP, SAL, OXY))))
+        return self._canyonb('nitrat_nncanyonb_bit18', np.transpose(np.vstack((DATE.to_numpy() // 10000, LATITUDE, LONGITUDE, -1 * PRES, CTDTMP, SAL, OXY))))
 
     def phspht_nncanyonb_bit18(self, DATE, LATITUDE, LONGITUDE, PRES, CTDTMP, SAL, OXY):
-        return self.oc.phspht_nncanyonb_bit18(np.transpose(np.vstack((DATE.to_numpy() // 10000, LATITUDE, LONGITUDE, -1 * PRES, CTDTMP, SAL, OXY))))
+        return self._canyonb('phspht_nncanyonb_bit18', np.transpose(np.vstack((DATE.to_numpy() // 10000, LATITUDE, LONGITUDE, -1 * PRES, CTDTMP, SAL, OXY))))
 
     def silcat_nncanyonb_bit18(self, DATE, LATITUDE, LONGITUDE, PRES, CTDTMP, SAL, OXY):
-        return self.oc.silcat_nncanyonb_bit18(np.transpose(np.vstack((DATE.to_numpy() // 10000, LATITUDE, LONGITUDE, -1 * PRES, CTDTMP, SAL, OXY))))
+        return self._canyonb('silcat_nncanyonb_bit18', np.transpose(np.vstack((DATE.to_numpy() // 10000, LATITUDE, LONGITUDE, -1 * PRES, CTDTMP, SAL, OXY))))
 
     def alkali_nncanyonb_bit18(self, DATE, LATITUDE, LONGITUDE, PRES, CTDTMP, SAL, OXY):
-        return self.oc.alkali_nncanyonb_bit18(np.transpose(np.vstack((DATE.to_numpy() // 10000, LATITUDE, LONGITUDE, -1 * PRES, CTDTMP, SAL, OXY))))
+        return self._canyonb('alkali_nncanyonb_bit18', np.transpose(np.vstack((DATE.to_numpy() // 10000, LATITUDE, LONGITUDE, -1 * PRES, CTDTMP, SAL, OXY))))
 
     def tcarbn_nncanyonb_bit18(self, DATE, LATITUDE, LONGITUDE, PRES, CTDTMP, SAL, OXY):
-        return self.oc.tcarbn_nncanyonb_bit18(np.transpose(np.vstack((DATE.to_numpy() // 10000, LATITUDE, LONGITUDE, -1 * PRES, CTDTMP, SAL, OXY))))
+        return self._canyonb('tcarbn_nncanyonb_bit18', np.transpose(np.vstack((DATE.to_numpy() // 10000, LATITUDE, LONGITUDE, -1 * PRES, CTDTMP, SAL, OXY))))
 
     def phts25p0_nncanyonb_bit18(self, DATE, LATITUDE, LONGITUDE, PRES, CTDTMP, SAL, OXY):
-        return self.oc.phts25p0_nncanyonb_bit18(np.transpose(np.vstack((DATE.to_numpy() // 10000, LATITUDE, LONGITUDE, -1 * PRES, CTDTMP, SAL, OXY))))
+        return self._canyonb('phts25p0_nncanyonb_bit18', np.transpose(np.vstack((DATE.to_numpy() // 10000, LATITUDE, LONGITUDE, -1 * PRES, CTDTMP, SAL, OXY))))
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#    License, authors, contributors and copyright information at:       #
+#    AUTHORS and LICENSE files at the root folder of this application   #
+#########################################################################
+
+from bokeh.util.logconfig import bokeh_logger as lg
+from ocean_data_qc.constants import *
+
+import numpy as np
+import pandas as pd
+
+
+class StationIndex(object):
+    ''' Index of the rows of each station of a DataFrame (CruiseData.df)
+
+        The stations and casts are encoded as categorical codes, in order of appearance.
+        The row positions are sorted by station code and pressure once, so the rows of
+        a station are a slice of that array instead of a scan of the STNNBR column:
+
+            order = [3, 0, 1, 2, 4, 5]     # row positions sorted by station and pressure
+            bounds = [0, 4, 6]             # station 0 >> order[0:4], station 1 >> order[4:6]
+
+        NOTE: The rows of the DataFrame are not moved because the row positions
+              are shared with cds_df, the ColumnDataSource and the exported files
+    '''
+
+    def __init__(self, df):
+        self.df_index = df.index
+        self.stt_codes, stations = self._factorize(df[STNNBR])
+        self.stations = stations.tolist()
+        self.stt_pos = {stt: i for i, stt in enumerate(self.stations)}
+        self.nan_stt_pos = next((i for i, stt in enumerate(self.stations) if pd.isnull(stt)), None)
+        if 'CASTNO' in df:
+            self.cast_codes, casts = self._factorize(df['CASTNO'])
+            self.casts = casts.tolist()
+        else:
+            self.cast_codes, self.casts = np.zeros(df.index.size, dtype=np.intp), []
+
+        if CTDPRS in df:
+            prs = pd.to_numeric(df[CTDPRS], errors='coerce').to_numpy(dtype=float)
+        else:
+            prs = np.zeros(df.index.size)
+        self.order = np.lexsort((prs, self.stt_codes))          # NaN pressures at the end of each station
+        self.bounds = np.searchsorted(
+            self.stt_codes[self.order], np.arange(len(self.stations) + 1)
+        )
+
+    def _factorize(self, values):
+        ''' The NaN values are kept as one more code, so the rows without station are not lost '''
+        try:
+            return pd.factorize(values, use_na_sentinel=False)
+        except TypeError:   # pandas < 1.5
+            return pd.factorize(values, na_sentinel=None)
+
+    def get_stt_rows(self, stt):
+        ''' Row positions of the station sorted by pressure, an empty array if it does not exist '''
+        if pd.isnull(stt):
+            pos = self.nan_stt_pos      # NOTE: NaN != NaN, so it cannot be found in stt_pos
+        else:
+            pos = self.stt_pos.get(stt, None)
+        if pos is None:
+            return self.order[0:0]
+        return self.order[self.bounds[pos]:self.bounds[pos + 1]]
+
+    def get_rows(self, stations=[], sort=False):
+        ''' Row positions of the stations, sorted by station and pressure
+                @stations - list of stations, in the order they are returned
+                @sort - whether to return the positions in the DataFrame order
+        '''
+        if len(stations) == 0:
+            return self.order[0:0]
+        rows = np.concatenate([self.get_stt_rows(stt) for stt in stations])
+        if sort:
+            rows.sort()
+        return rows
@@ -8,6 +8,9 @@ from bokeh.util.logconfig import bokeh_logger as lg
 from ocean_data_qc.constants import *
 from ocean_data_qc.data_models.exceptions import ValidationError
 
+import numpy as np
+import pandas as pd
+
 ''' Common basic functions used in the entire program '''
 
 def merge(d1, d2):
@@ -36,4 +39,79 @@ def merge(d1, d2):
             d1[c] = t_list
         elif c in d2 and c not in d1:
             d1[c] = d2[c]
-    return d1
\ No newline at end of file
+    return d1
+
+
+def get_patches(old_data, new_data, max_ratio=PATCH_MAX_RATIO):
+    ''' Compares the data of a ColumnDataSource with the new data and returns
+        the patches to update only the changed cells. The consecutive changed
+        cells of the numeric columns are coalesced in slices:
+
+            {
+                'x': [(slice(2, 5), array([1., 2., 3.])), (7, 4.0)],
+                'xs0': [(1, array([1., 2.]))]
+            }
+
+        None is returned if the whole data should be sent instead: the columns
+        or the number of rows changed, or the ratio of changed cells is larger than max_ratio
+
+        NOTE: How to patch NaN values: https://github.com/bokeh/bokeh/issues/7525
+              The indices must be int (Int64 throws error)
+    '''
+    if set(old_data.keys()) != set(new_data.keys()):
+        return None
+    n_rows = None
+    for c in new_data:
+        if n_rows is None:
+            n_rows = len(new_data[c])
+        if len(new_data[c]) != n_rows or len(old_data[c]) != n_rows:
+            return None
+    if n_rows is None or n_rows == 0:
+        return {}
+
+    patches = {}
+    n_changed = 0
+    max_changed = max_ratio * n_rows * len(new_data)
+    for c in new_data:
+        old, new = old_data[c], new_data[c]
+        if (
+            isinstance(old, np.ndarray) and isinstance(new, np.ndarray)
+            and old.dtype.kind in 'biuf' and new.dtype.kind in 'biuf'
+        ):
+            changed = np.flatnonzero((old != new) & ~(pd.isnull(old) & pd.isnull(new)))
+            if changed.size > 0:
+                patches[c] = _get_slice_patches(changed, new)
+        else:   # strings or multiline arrays, cell by cell
+            changed = [i for i in range(n_rows) if not _is_same_value(old[i], new[i])]
+            if changed != []:
+                patches[c] = [(i, new[i]) for i in changed]
+        n_changed += len(changed)
+        if n_changed > max_changed:
+            return None
+    return patches
+
+
+def _get_slice_patches(changed, new):
+    ''' Coalesces the runs of consecutive changed positions in slices
+            @changed - sorted positions of the changed cells
+            @new - new values of the column
+    '''
+    breaks = np.flatnonzero(np.diff(changed) != 1) + 1
+    starts = changed[np.r_[0, breaks]]
+    ends = changed[np.r_[breaks - 1, changed.size - 1]] + 1
+    patches = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        if end - start == 1 and not pd.isnull(new[start]):
+            patches.append((start, new[start].item()))
+        else:
+            patches.append((slice(start, end), new[start:end]))
+    return patches
+
+
+def _is_same_value(a, b):
+    if isinstance(a, (np.ndarray, list)) or isinstance(b, (np.ndarray, list)):
+        a, b = np.asarray(a), np.asarray(b)
+        if a.shape != b.shape:
+            return False
+        return bool(((a == b) | (pd.isnull(a) & pd.isnull(b))).all())
+    return a == b or (pd.isnull(a) and pd.isnull(b))
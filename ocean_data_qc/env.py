@@ -53,6 +53,8 @@ class Environment(object):
     ml_src = None                # Multiline Profiles CDS
     pc_src = None                # Profile circles´s source, column name example:
                                     # NITRAT_NITRAT_2 (TAB_COLUMN_PROFNUMBER)
+                                    # It only has the rows of the current profiles
+    pc_rows = []                    # cds_df row position of each pc_src row
     astk_src = None          # Asterisk CDS >> 0 or 1 (if at least one point is selected)
                                     # The lines with all the columns are store in thos source
     flag_views = {}                 # Views that are shared in all plots of a tab
@@ -62,6 +64,7 @@ class Environment(object):
     # ------------------------------- VARIABLES ------------------------------------- #
 
     oct_exe_path = ''               # path where the octave executable is
+    eq_backend = 'octave'           # backend of the closed-form equations (aou_gg and CO2SYS): 'numpy' or 'octave'
 
     n_plots = 0                     # Number of plots. This value should be updated if the number changes
                                     #    There is an alternative variable on the BokehPlotsHandler class
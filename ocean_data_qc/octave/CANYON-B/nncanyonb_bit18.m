@@ -0,0 +1,24 @@
+function out = nncanyonb_bit18(data, params)
+%nncanyonb_bit18 - Computes several CANYON-B outputs with one single call
+%
+% Syntax: output = nncanyonb_bit18(data, params)
+%
+% params is a comma separated list of CANYON-B parameters, for instance 'AT,CT,NO3'.
+% The output has one column per parameter, in the same order
+
+year_=data(:,1);
+lat=data(:,2);
+lon=data(:,3);
+pres=data(:,4);
+temp=data(:,5);
+psal=data(:,6);
+doxy=data(:,7);
+
+params=strsplit(params, ',');
+res=CANYONB(year_,lat,lon,pres,temp,psal,doxy,params);
+out=zeros(size(data,1), numel(params));
+for i=1:numel(params)
+    out(:,i)=res.(params{i})(:);
+end
+
+end
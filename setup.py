@@ -46,6 +46,7 @@ requires = [
     'bokeh ==2.2.3',
     'pandas >=1.0.3',
     'seawater >=3.3.4',
+    'numexpr >=2.7.1',  # arithmetic of the computed parameters, NumPy is used if it is not installed
     'more_itertools >=8.2.0',
     'oct2py >=5.0.4',
     'scipy >=1.4.1',  # oct2py needs it, though it is not a direct dependency
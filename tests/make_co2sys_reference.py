@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#    License, authors, contributors and copyright information at:       #
+#    AUTHORS and LICENSE files at the root folder of this application   #
+#########################################################################
+
+''' Generates tests/data/co2sys_reference.csv, the reference values of the octave wrappers
+        * tcarbn_from_alkali_phsws25p0.m
+        * tcarbn_from_alkali_phts25p0.m
+        * phts25p0_from_alkali_tcarbn.m
+
+    The values are computed with the octave functions of ocean_data_qc/octave (through oct2py)
+    if octave is installed. Otherwise PyCO2SYS is used with the same options of the wrappers:
+    K1K2CONSTANTS = 10, KSO4CONSTANTS = 1, 25 ºC and 0 dbar in the input and in the output.
+    The source of the values is written in the first line of the file
+
+    Usage: python tests/make_co2sys_reference.py [--pyco2sys]
+'''
+
+import os
+import sys
+import shutil
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OCTAVE_FOLDER = os.path.join(ROOT, 'ocean_data_qc', 'octave')
+REFERENCE_CSV = os.path.join(ROOT, 'tests', 'data', 'co2sys_reference.csv')
+
+WRAPPERS = {    # {'OUTPUT_COLUMN': ('function', [input columns])}
+    'TCARBN_FROM_ALKALI_PHSWS25P0': ('tcarbn_from_alkali_phsws25p0', ['ALKALI', 'PH_SWS', 'SAL', 'SILCAT', 'PHSPHT']),
+    'TCARBN_FROM_ALKALI_PHTS25P0': ('tcarbn_from_alkali_phts25p0', ['ALKALI', 'PH_TOT', 'SAL', 'SILCAT', 'PHSPHT']),
+    'PHTS25P0_FROM_ALKALI_TCARBN': ('phts25p0_from_alkali_tcarbn', ['ALKALI', 'TCARBN', 'SAL', 'SILCAT', 'PHSPHT']),
+}
+
+
+def get_inputs():
+    ''' Usual ranges of the bottle data, and one row with a NaN value '''
+    rng = np.random.default_rng(2020)
+    n = 40
+    df = pd.DataFrame({
+        'ALKALI': rng.uniform(2200, 2450, n),
+        'PH_SWS': rng.uniform(7.5, 8.1, n),
+        'PH_TOT': rng.uniform(7.5, 8.1, n),
+        'TCARBN': rng.uniform(1950, 2300, n),
+        'SAL': rng.uniform(33, 37.5, n),
+        'SILCAT': rng.uniform(0, 150, n),
+        'PHSPHT': rng.uniform(0, 3, n),
+    }).round(4)
+    df.loc[n - 1, 'SILCAT'] = np.nan
+    return df
+
+
+def get_octave_values(df):
+    import oct2py
+    oc = oct2py.Oct2Py()
+    oc.addpath(OCTAVE_FOLDER)
+    for col, (func, inputs) in WRAPPERS.items():
+        df[col] = np.asarray(getattr(oc, func)(df[inputs].to_numpy())).ravel()
+    version = oc.feval('version')
+    oc.exit()
+    return 'octave {}'.format(version)
+
+
+def get_pyco2sys_values(df):
+    import PyCO2SYS as pyco2
+    common = dict(
+        par1=df['ALKALI'].to_numpy(), par1_type=1, salinity=df['SAL'].to_numpy(),
+        temperature=25, temperature_out=25, pressure=0, pressure_out=0,
+        total_silicate=df['SILCAT'].to_numpy(), total_phosphate=df['PHSPHT'].to_numpy(),
+        opt_k_carbonic=10, opt_k_bisulfate=1, opt_total_borate=1,
+    )
+    F = ~df[['ALKALI', 'SAL', 'SILCAT', 'PHSPHT']].isnull().any(axis=1).to_numpy()
+    results = {
+        'TCARBN_FROM_ALKALI_PHSWS25P0': pyco2.sys(par2=df['PH_SWS'].to_numpy(), par2_type=3, opt_pH_scale=2, **common)['dic'],
+        'TCARBN_FROM_ALKALI_PHTS25P0': pyco2.sys(par2=df['PH_TOT'].to_numpy(), par2_type=3, opt_pH_scale=1, **common)['dic'],
+        'PHTS25P0_FROM_ALKALI_TCARBN': pyco2.sys(par2=df['TCARBN'].to_numpy(), par2_type=2, opt_pH_scale=2, **common)['pH_total_out'],
+    }
+    for col, values in results.items():
+        df[col] = np.where(F, values, np.nan)   # as the octave wrappers
+    return 'PyCO2SYS {}'.format(pyco2.__version__)
+
+
+if __name__ == '__main__':
+    df = get_inputs()
+    if '--pyco2sys' not in sys.argv and shutil.which('octave-cli') is not None:
+        source = get_octave_values(df)
+    else:
+        source = get_pyco2sys_values(df)
+    with open(REFERENCE_CSV, 'w', newline='') as f:
+        f.write('# source: {}\n'.format(source))
+        df.to_csv(f, index=False, float_format='%.10f')
+    print('>> REFERENCE VALUES WRITTEN WITH {}: {}'.format(source, REFERENCE_CSV))
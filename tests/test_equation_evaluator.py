@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#    License, authors, contributors and copyright information at:       #
+#    AUTHORS and LICENSE files at the root folder of this application   #
+#########################################################################
+
+''' The equations evaluated by EquationEvaluator should give the same results
+    as DataFrame.eval(engine='python'):
+        * with NumPy the values and the types are identical
+        * with numexpr the types are identical and the values are equal up to the
+          floating point rounding (relative difference < 1E-12), numexpr computes
+          the powers and the divisions by constants in a different way
+'''
+
+import os
+import importlib.util
+import numpy as np
+import pandas as pd
+import pytest
+
+from ocean_data_qc.constants import OCEAN_DATA_QC_PY
+
+# NOTE: the module is loaded from its file because importing the data_models package
+#       instantiates the handlers of the application (bokeh document, octave, ...)
+spec = importlib.util.spec_from_file_location(
+    'equation_evaluator', os.path.join(OCEAN_DATA_QC_PY, 'data_models', 'equation_evaluator.py')
+)
+equation_evaluator = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(equation_evaluator)
+
+FUNCS = {
+    'sat': lambda SAL, THETA: 300 - 2 * THETA - 0.5 * SAL,
+    'double': lambda X: np.asarray(X, dtype=float).reshape(-1, 1) * 2,     # one column, as the octave functions
+}
+EQUATIONS = [
+    '_OXYGEN + 135 * PHSPHT',                       # PO
+    '_OXYGEN + 9 * _NITRATE',                       # NO
+    'ALKALI * 35 / _SALINITY',                      # NTA
+    '_NITRATE - 16 * PHSPHT + 2',                   # N_STAR
+    'ALKALI / TCARBN -1',
+    '@sat(_SALINITY, THETA) / (22.414 * 1E-6) - _OXYGEN',
+    '@double(_OXYGEN + 1)',
+    '_OXYGEN',
+    '2 + 3 * 4',
+    '1.5 ** 2',
+    '-_OXYGEN',
+    '-(_NITRATE - PHSPHT) * +2',
+    '_SALINITY ** 2 - THETA ** 0.5',
+    '_NITRATE % 3',
+    'STNNBR % 4 + CASTNO',
+    '_NITRATE // 3',
+    'STNNBR // 2',
+    'STNNBR ** 2 - CASTNO',
+    'NITRAT_FLAG_W * 2',
+    'NITRAT_FLAG_W + _NITRATE',
+    'NITRAT_FLAG_W % 3',
+    'NITRAT_FLAG_W // 2 - STNNBR',
+]
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(7)
+    n = 50
+    df = pd.DataFrame({
+        '_OXYGEN': rng.uniform(150, 300, n),
+        '_NITRATE': rng.uniform(-1, 40, n),
+        'PHSPHT': rng.uniform(0, 3, n),
+        'ALKALI': rng.uniform(2200, 2450, n),
+        'TCARBN': rng.uniform(1950, 2300, n),
+        '_SALINITY': rng.uniform(33, 37.5, n),
+        'THETA': rng.uniform(-1.5, 28, n),
+        'STNNBR': rng.integers(1, 120, n),
+        'CASTNO': rng.integers(1, 4, n),
+        'NITRAT_FLAG_W': rng.choice([2, 3, 4, 9], n).astype('uint8'),
+    }, index=['hash_{}'.format(i) for i in range(n)])
+    df.loc[df.index[::7], '_NITRATE'] = np.nan
+    return df
+
+
+def evaluate(eq, df):
+    ''' As ComputedParameter.compute_equation, with the python engine as fallback '''
+    evaluator = equation_evaluator.EquationEvaluator(FUNCS)
+    try:
+        return evaluator.evaluate(eq, df)
+    except equation_evaluator.UnsupportedEquation:
+        return python_eval(eq, df)
+
+
+def python_eval(eq, df):
+    return df.eval(expr=eq, engine='python', local_dict=FUNCS, global_dict={})
+
+
+def as_column(values, df):
+    ''' The values are assigned to a DataFrame column, as compute_equation does '''
+    res = pd.DataFrame(index=df.index)
+    res['CP'] = values
+    return res['CP']
+
+
+@pytest.mark.parametrize('use_numexpr', [True, False])
+@pytest.mark.parametrize('eq', EQUATIONS)
+def test_same_results_as_python_engine(df, eq, use_numexpr, monkeypatch):
+    if use_numexpr:
+        pytest.importorskip('numexpr')
+    else:
+        monkeypatch.setattr(equation_evaluator, 'ne', None)
+    pd.testing.assert_series_equal(
+        as_column(evaluate(eq, df), df), as_column(python_eval(eq, df), df),
+        check_exact=not use_numexpr, rtol=1E-12, atol=0
+    )
+
+
+def test_function_columns_in_arithmetic(df):
+    ''' The octave functions return one column (n x 1). The python engine cannot use it
+        in the arithmetic, the evaluator uses it as a 1-D array
+    '''
+    with pytest.raises(ValueError):
+        python_eval('@double(_OXYGEN) - _NITRATE', df)
+    values = equation_evaluator.EquationEvaluator(FUNCS).evaluate('@double(_OXYGEN) - _NITRATE', df)
+    np.testing.assert_array_equal(values, df['_OXYGEN'].to_numpy() * 2 - df['_NITRATE'].to_numpy())
+
+
+def test_numexpr_errors_are_unsupported(df):
+    pytest.importorskip('numexpr')
+    evaluator = equation_evaluator.EquationEvaluator(FUNCS)
+    with pytest.raises(equation_evaluator.UnsupportedEquation):
+        evaluator.evaluate('STNNBR ** -1', df)      # integers to negative integer powers
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#    License, authors, contributors and copyright information at:       #
+#    AUTHORS and LICENSE files at the root folder of this application   #
+#########################################################################
+
+''' The NumPy ports of aou_gg.m and the CO2SYS.m wrappers are compared with the reference values.
+    Tolerances:
+        * AOU: 0.001 umol/kg
+        * TCARBN: 0.01 umol/kg, one tenth of the precision of the CO2SYS results
+        * pH: 0.0001, the convergence tolerance of the pH iteration of CO2SYS.m
+'''
+
+import os
+import shutil
+import importlib.util
+import numpy as np
+import pandas as pd
+import pytest
+
+from ocean_data_qc.constants import OCEAN_DATA_QC_PY
+
+# NOTE: the module is loaded from its file because importing the data_models package
+#       instantiates the handlers of the application (bokeh document, octave, ...)
+spec = importlib.util.spec_from_file_location(
+    'numpy_equations', os.path.join(OCEAN_DATA_QC_PY, 'data_models', 'numpy_equations.py')
+)
+numpy_equations = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(numpy_equations)
+NumpyEquations = numpy_equations.NumpyEquations
+
+REFERENCE_CSV = os.path.join(os.path.dirname(__file__), 'data', 'co2sys_reference.csv')
+TOLERANCES = {
+    'AOU_GG': 0.001,
+    'TCARBN_FROM_ALKALI_PHSWS25P0': 0.01,
+    'TCARBN_FROM_ALKALI_PHTS25P0': 0.01,
+    'PHTS25P0_FROM_ALKALI_TCARBN': 0.0001,
+}
+WRAPPERS = {
+    'TCARBN_FROM_ALKALI_PHSWS25P0': ('tcarbn_from_alkali_phsws25p0', ['ALKALI', 'PH_SWS', 'SAL', 'SILCAT', 'PHSPHT']),
+    'TCARBN_FROM_ALKALI_PHTS25P0': ('tcarbn_from_alkali_phts25p0', ['ALKALI', 'PH_TOT', 'SAL', 'SILCAT', 'PHSPHT']),
+    'PHTS25P0_FROM_ALKALI_TCARBN': ('phts25p0_from_alkali_tcarbn', ['ALKALI', 'TCARBN', 'SAL', 'SILCAT', 'PHSPHT']),
+}
+
+
+@pytest.fixture(scope='module')
+def reference():
+    return pd.read_csv(REFERENCE_CSV, comment='#')
+
+
+def get_port_values(func, df, inputs):
+    return getattr(NumpyEquations(), func)(*[df[c] for c in inputs])[:, 0]
+
+
+def test_aou_gg_check_value():
+    ''' Check value of Garcia and Gordon (1992) for the Benson and Krause fit in umol/kg '''
+    aou = NumpyEquations().aou_gg([35.0], [10.0], [0.0])
+    assert aou.shape == (1, 1)
+    assert abs(aou[0, 0] - 274.610) < TOLERANCES['AOU_GG']
+
+
+@pytest.mark.parametrize('col', list(WRAPPERS.keys()))
+def test_co2sys_reference(reference, col):
+    func, inputs = WRAPPERS[col]
+    np.testing.assert_allclose(
+        get_port_values(func, reference, inputs), reference[col].to_numpy(),
+        rtol=0, atol=TOLERANCES[col], equal_nan=True
+    )
+
+
+@pytest.mark.skipif(shutil.which('octave-cli') is None, reason='octave is not installed')
+def test_octave_functions(reference):
+    ''' Compares the ports with the octave functions directly '''
+    oct2py = pytest.importorskip('oct2py')
+    oc = oct2py.Oct2Py()
+    oc.addpath(os.path.join(OCEAN_DATA_QC_PY, 'octave'))
+    try:
+        df = reference.copy()
+        df['THETA'] = np.linspace(-1.5, 28, df.index.size)
+        df['OXY'] = np.linspace(150, 300, df.index.size)
+        np.testing.assert_allclose(
+            get_port_values('aou_gg', df, ['SAL', 'THETA', 'OXY']),
+            np.asarray(oc.aou_gg(df[['SAL', 'THETA', 'OXY']].to_numpy())).ravel(),
+            rtol=0, atol=TOLERANCES['AOU_GG']
+        )
+        for col, (func, inputs) in WRAPPERS.items():
+            np.testing.assert_allclose(
+                get_port_values(func, df, inputs),
+                np.asarray(getattr(oc, func)(df[inputs].to_numpy())).ravel(),
+                rtol=0, atol=TOLERANCES[col], equal_nan=True, err_msg=func
+            )
+    finally:
+        oc.exit()